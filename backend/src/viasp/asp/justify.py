@@ -1,21 +1,32 @@
 """This module is concerned with finding reasons for why a stable model is found."""
-from collections import defaultdict
+import atexit
+import multiprocessing
+import threading
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from hashlib import sha1
 from logging import warn
-from typing import List, Collection, Dict, Iterable, Union, Set
+from typing import List, Collection, Dict, Iterable, Union, Set, Sequence, Callable, TypeVar, Tuple, Optional, FrozenSet, cast
 
 import networkx as nx
 
-from clingo import Control, Symbol, Model
+from clingo import Control, Symbol, Model, Function, Number, parse_term
 
-from clingo.ast import AST, ASTType
+from clingo.ast import AST, ASTType, parse_string
 
-from .reify import ProgramAnalyzer, reify_recursion_transformation, LiteralWrapper
+from .reify import ProgramAnalyzer, reify_recursion_transformation, LiteralWrapper, ModelIndexWrapper
 from .recursion import RecursionReasoner
 from .utils import insert_atoms_into_nodes, identify_reasons, calculate_spacing_factor
 from ..shared.model import Node, RuleContainer, Transformation, SymbolIdentifier
+from ..shared.defaults import JUSTIFICATION_WORKERS, JUSTIFICATION_PARALLEL_MIN_MODELS, JUSTIFICATION_BATCHED, \
+    JUSTIFICATION_BATCH_SIZE, DERIVATION_CACHE_MAX_ENTRIES, RECURSION_CACHE_MAX_ENTRIES
 from ..shared.simple_logging import info
 from ..shared.util import pairwise, get_leafs_from_graph
 
+T = TypeVar("T")
+T_in = TypeVar("T_in")
+
 
 def stringify_fact(fact: Symbol) -> str:
     return f"{str(fact)}."
@@ -27,24 +38,352 @@ def get_h_symbols_from_model(wrapped_stable_model: Iterable[str],
                              constants: List[Symbol],
                              h="h",
                              h_showTerm="h_showTerm") -> List[Symbol]:
-    rules_that_are_reasons_why = []
+    justification_program = make_justification_program(
+        transformed_prg, facts, constants, h)
+    return get_h_symbols_from_justification_program(justification_program,
+                                                    wrapped_stable_model,
+                                                    frozenset(facts), h,
+                                                    h_showTerm)
+
+
+def make_justification_program(transformed_prg: Collection[Union[str, AST]],
+                               facts: Collection[Symbol],
+                               constants: Collection[Symbol],
+                               h="h") -> List[str]:
+    """
+    Stringify the parts of the justification program that are the same for
+    every stable model.
+    """
+    return [
+        "".join(map(str, constants)),
+        "".join(map(stringify_fact, facts)),
+        "\n".join(map(str, transformed_prg)),
+    ]
+
+
+def select_first_derivations(h_symbols: Iterable[Symbol],
+                             facts: Collection[Symbol]) -> List[Symbol]:
+    """
+    Keep the h symbols of every atom that are derived by the first rule
+    deriving it, except for the facts, in a single pass.
+    """
+    first: Dict[Symbol, List[Symbol]] = {}
+    for sym in h_symbols:
+        rule_nr, symbol, _ = sym.arguments
+        if symbol in facts:
+            continue
+        derivations = first.get(symbol)
+        if derivations is None or rule_nr < derivations[0].arguments[0]:
+            first[symbol] = [sym]
+        elif rule_nr == derivations[0].arguments[0]:
+            derivations.append(sym)
+    return [sym for derivations in first.values() for sym in derivations]
+
+
+def select_reasons(derivations: Iterable[Symbol],
+                   facts: Collection[Symbol],
+                   h="h") -> List[Symbol]:
+    """
+    Select the first derivations among the h symbols and keep all other
+    symbols, e.g. the h_showTerm symbols, as they are.
+    """
+    h_symbols, other_symbols = [], []
+    for sym in derivations:
+        (h_symbols if sym.match(h, 3) else other_symbols).append(sym)
+    return select_first_derivations(h_symbols, facts) + other_symbols
+
+
+def get_derivations_from_justification_program(justification_program: Sequence[str],
+                                               wrapped_stable_model: Iterable[str],
+                                               h="h",
+                                               h_showTerm="h_showTerm") -> List[Symbol]:
     ctl = Control()
-    stringified = "\n".join(map(str, transformed_prg))
-    new_head = f"_{h}"
-    get_new_atoms_rule = f"{new_head}(I, H, G) :- {h}(I, H, G), not {h}(II,H,_) : II<I, {h}(II,_,_)."
-    ctl.add("base", [], "".join(map(str, constants)))
-    ctl.add("base", [], "".join(map(stringify_fact, facts)))
-    ctl.add("base", [], stringified)
+    for part in justification_program:
+        ctl.add("base", [], part)
     ctl.add("base", [], "".join(map(str, wrapped_stable_model)))
-    ctl.add("base", [], get_new_atoms_rule)
     ctl.ground([("base", [])])
-    for x in ctl.symbolic_atoms.by_signature(new_head, 3):
-        if x.symbol.arguments[1] in facts:
-            continue
-        rules_that_are_reasons_why.append(x.symbol)
+    derivations = [x.symbol for x in ctl.symbolic_atoms.by_signature(h, 3)]
     for x in ctl.symbolic_atoms.by_signature(h_showTerm, 3):
-        rules_that_are_reasons_why.append(x.symbol)
-    return rules_that_are_reasons_why
+        derivations.append(x.symbol)
+    return derivations
+
+
+def get_h_symbols_from_justification_program(justification_program: Sequence[str],
+                                             wrapped_stable_model: Iterable[str],
+                                             facts: Collection[Symbol],
+                                             h="h",
+                                             h_showTerm="h_showTerm") -> List[Symbol]:
+    return select_reasons(
+        get_derivations_from_justification_program(justification_program,
+                                                   wrapped_stable_model, h,
+                                                   h_showTerm), facts, h)
+
+
+def make_batched_justification_program(justification_program: Sequence[str],
+                                       model="model") -> List[str]:
+    """
+    Rewrite the parts of the justification program to hold for every model
+    index ``M`` with ``model(M)``, so that they are parsed and grounded only
+    once for all models of a batch. Raises a ValueError if the program holds
+    statements other than rules.
+    """
+    constants, facts, *rules = justification_program
+    wrapper = ModelIndexWrapper(wrap_str=model)
+    batched = [constants]
+    parse_string("\n".join([facts, *rules]),
+                 lambda statement: batched.append(str(wrapper.wrap(statement))))
+    return batched
+
+
+def get_derivations_of_models_batched(batched_justification_program: Sequence[str],
+                                      wrapped_stable_models: Sequence[Iterable[str]],
+                                      model="model",
+                                      h="h",
+                                      h_showTerm="h_showTerm") -> List[List[Symbol]]:
+    """
+    Ground the batched justification program once together with all models,
+    each one tagged with its index, and split the derivations by model.
+    """
+    derivations: List[List[Symbol]] = [[] for _ in wrapped_stable_models]
+    ctl = Control()
+    for part in batched_justification_program:
+        ctl.add("base", [], part)
+    for index, wrapped_stable_model in enumerate(wrapped_stable_models):
+        ctl.add("base", [], f"{model}({index}).")
+        ctl.add("base", [], "".join(f"{model}({index},{atom.rstrip().rstrip('.')})."
+                                    for atom in wrapped_stable_model))
+    ctl.ground([("base", [])])
+    for x in ctl.symbolic_atoms.by_signature(model, 2):
+        index, symbol = x.symbol.arguments
+        if symbol.match(h, 3) or symbol.match(h_showTerm, 3):
+            derivations[index.number].append(symbol)
+    return derivations
+
+
+def get_derivations_of_models(justification_program: Sequence[str],
+                              wrapped_stable_models: List[List[str]],
+                              model="model",
+                              h="h",
+                              h_showTerm="h_showTerm",
+                              workers: int = JUSTIFICATION_WORKERS,
+                              batched: bool = JUSTIFICATION_BATCHED,
+                              batch_size: int = JUSTIFICATION_BATCH_SIZE) -> List[List[Symbol]]:
+    """
+    Get the h and h_showTerm symbols of every model, in the order of the
+    models. Batched, the models are split into one batch per worker, of at
+    most batch_size models each, and each batch is grounded at once.
+    Otherwise, or if the program cannot be batched, every model is grounded
+    on its own.
+    """
+    if not wrapped_stable_models:
+        return []
+    batched_justification_program = None
+    if batched:
+        try:
+            batched_justification_program = make_batched_justification_program(
+                justification_program, model)
+        except ValueError as e:
+            info(f"Grounding the models one by one. {e}")
+    if batched_justification_program is None:
+        return map_models(
+            partial(get_derivations_from_justification_program,
+                    justification_program,
+                    h=h,
+                    h_showTerm=h_showTerm), wrapped_stable_models, workers)
+    parallel = len(wrapped_stable_models) >= JUSTIFICATION_PARALLEL_MIN_MODELS
+    batches = max(1, min(workers, len(wrapped_stable_models))) if parallel else 1
+    batches = max(batches, -(-len(wrapped_stable_models) // max(1, batch_size)))
+    size = -(-len(wrapped_stable_models) // batches)
+    results = map_models(
+        partial(get_derivations_of_models_batched,
+                batched_justification_program,
+                model=model,
+                h=h,
+                h_showTerm=h_showTerm),
+        [wrapped_stable_models[i:i + size]
+         for i in range(0, len(wrapped_stable_models), size)],
+        min(workers, batches) if parallel else 1,
+        min_models=2)
+    return [derivations for batch in results for derivations in batch]
+
+
+class DerivationCache:
+    """
+    Bounded LRU of the derivations of a transformation in a stable model,
+    keyed by (program hash, model hash, transformation hash). They don't
+    depend on the position of the transformation in the sort, so they are
+    stored without the rule index.
+    """
+
+    def __init__(self, max_entries: int = DERIVATION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Tuple[Tuple[str, Symbol, Symbol], ...]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Tuple[str, str, str], derivations: Tuple[Tuple[str, Symbol, Symbol], ...]):
+        with self._lock:
+            self._entries[key] = derivations
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+derivation_cache = DerivationCache()
+
+
+def hash_parts(parts: Iterable[str]) -> str:
+    hash_object = sha1()
+    for part in parts:
+        hash_object.update(sha1(part.encode()).hexdigest().encode())
+    return hash_object.hexdigest()
+
+
+def get_derivations_of_models_cached(justification_program: Sequence[str],
+                                     wrapped_stable_models: List[List[str]],
+                                     sorted_program: Sequence[Transformation],
+                                     model="model",
+                                     h="h",
+                                     h_showTerm="h_showTerm",
+                                     workers: int = JUSTIFICATION_WORKERS,
+                                     batched: bool = JUSTIFICATION_BATCHED,
+                                     cache: DerivationCache = derivation_cache) -> List[List[Symbol]]:
+    """
+    Like get_derivations_of_models, but only the models with a transformation
+    missing from the cache are grounded. The cached derivations are given the
+    rule index of the transformation in the current sort, so a reordering of
+    the same transformations needs no grounding at all.
+    """
+    constants, facts = justification_program[0], justification_program[1]
+    program_hash = hash_parts([constants, facts, h, h_showTerm])
+    keys = [[(program_hash, hash_parts(sorted(wrapped_stable_model)), t.hash)
+             for t in sorted_program]
+            for wrapped_stable_model in wrapped_stable_models]
+    derivations: List[Optional[List[Symbol]]] = []
+    for model_keys in keys:
+        cached = [cache.get(key) for key in model_keys]
+        if any(entry is None for entry in cached):
+            derivations.append(None)
+            continue
+        derivations.append([
+            Function(name, [Number(t.id), symbol, reasons])
+            for t, entry in zip(sorted_program, cached)
+            for name, symbol, reasons in cast(Tuple, entry)
+        ])
+    missing = [i for i, entry in enumerate(derivations) if entry is None]
+    grounded = get_derivations_of_models(
+        justification_program, [wrapped_stable_models[i] for i in missing],
+        model=model, h=h, h_showTerm=h_showTerm, workers=workers, batched=batched)
+    for i, symbols in zip(missing, grounded):
+        by_rule_nr: Dict[int, List[Tuple[str, Symbol, Symbol]]] = defaultdict(list)
+        for sym in symbols:
+            rule_nr, symbol, reasons = sym.arguments
+            by_rule_nr[rule_nr.number].append((sym.name, symbol, reasons))
+        for t, key in zip(sorted_program, keys[i]):
+            cache.put(key, tuple(by_rule_nr[t.id]))
+        derivations[i] = symbols
+    return cast(List[List[Symbol]], derivations)
+
+
+def map_models(function: Callable[[T_in], T],
+               wrapped_stable_models: List[T_in],
+               workers: int = JUSTIFICATION_WORKERS,
+               min_models: int = JUSTIFICATION_PARALLEL_MIN_MODELS) -> List[T]:
+    """
+    Apply the function to every model. With more than one worker and at least
+    min_models models, they are distributed over a process pool. The results
+    are returned in the order of the models either way.
+    """
+    workers = min(workers, len(wrapped_stable_models))
+    if workers <= 1 or len(wrapped_stable_models) < min_models:
+        return list(map(function, wrapped_stable_models))
+    return [
+        decode_symbols(result) for result in get_worker_pool(workers).map(
+            partial(call_with_encoded_symbols, function),
+            map(encode_symbols, wrapped_stable_models),
+            chunksize=max(1, len(wrapped_stable_models) // (4 * workers)))
+    ]
+
+
+_worker_pool: Optional[ProcessPoolExecutor] = None
+_worker_pool_size = 0
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Return the process pool shared by all requests, growing it if it has less
+    than the given number of workers. The server is multithreaded, so the
+    workers are started from a fresh interpreter (forkserver or spawn) instead
+    of forking the server with the locks of its other threads.
+    """
+    global _worker_pool, _worker_pool_size
+    with _worker_pool_lock:
+        if _worker_pool is None or _worker_pool_size < workers:
+            if _worker_pool is not None:
+                _worker_pool.shutdown(wait=False)
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _worker_pool = ProcessPoolExecutor(max_workers=workers,
+                                               mp_context=multiprocessing.get_context(method))
+            _worker_pool_size = workers
+        return _worker_pool
+
+
+def shutdown_worker_pool():
+    global _worker_pool, _worker_pool_size
+    with _worker_pool_lock:
+        if _worker_pool is not None:
+            _worker_pool.shutdown()
+        _worker_pool = None
+        _worker_pool_size = 0
+
+
+atexit.register(shutdown_worker_pool)
+
+
+class EncodedSymbol(str):
+    """
+    A symbol on its way to or from a worker process. Symbols are pickled as
+    references into the symbol table of their process, so they are sent as
+    strings and parsed again on the other side.
+    """
+
+
+def encode_symbols(obj):
+    if isinstance(obj, Symbol):
+        return EncodedSymbol(obj)
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return type(obj)(map(encode_symbols, obj))
+    return obj
+
+
+def decode_symbols(obj):
+    if isinstance(obj, EncodedSymbol):
+        return parse_term(obj)
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return type(obj)(map(decode_symbols, obj))
+    return obj
+
+
+def call_with_encoded_symbols(function: Callable[[T_in], T], item: T_in):
+    return encode_symbols(function(decode_symbols(item)))
 
 
 def get_facts(original_program) -> Collection[Symbol]:
@@ -99,12 +438,15 @@ def make_reason_path_from_facts_to_stable_model(rule_mapping: Dict[int, Transfor
                                             recursive_transformations_hashes: Set[str],
                                             h="h",
                                             analyzer: ProgramAnalyzer = ProgramAnalyzer(),
-                                            pad=True) \
+                                            pad=True,
+                                            interned: Optional[Dict[Tuple, Node]] = None) \
                                             -> nx.DiGraph:
     h_syms: List[Node] = collect_h_symbols_and_create_nodes(
         h_symbols, rule_mapping.keys(), pad)
     h_syms.sort(key=lambda node: node.rule_nr)
     h_syms.insert(0, fact_node)
+    if interned is not None:
+        intern_nodes(h_syms, interned)
 
     insert_atoms_into_nodes(h_syms)
     g = nx.DiGraph()
@@ -112,12 +454,13 @@ def make_reason_path_from_facts_to_stable_model(rule_mapping: Dict[int, Transfor
         # If there is a stable model that is exactly the same as the facts.
         g.add_edge(fact_node,
                    Node(frozenset(), min(rule_mapping.keys()),
-                        frozenset(fact_node.diff)),
+                        parent=fact_node),
                    transformation=rule_mapping[min(rule_mapping.keys())])
         return g
 
     for a, b in pairwise(h_syms):
-        if rule_mapping[b.rule_nr].hash in recursive_transformations_hashes:
+        if rule_mapping[b.rule_nr].hash in recursive_transformations_hashes \
+                and not b.recursive:
             b.recursive = get_recursion_subgraph(a.atoms, b.diff,
                                                  rule_mapping[b.rule_nr], h,
                                                  analyzer)
@@ -126,7 +469,29 @@ def make_reason_path_from_facts_to_stable_model(rule_mapping: Dict[int, Transfor
     return g
 
 
+def intern_nodes(path: List[Node], interned: Dict[Tuple, Node]) -> None:
+    """
+    Replace the nodes of the path by equal nodes of earlier paths. Nodes are
+    equal if they have the same predecessor, rule and diff, so they are
+    looked up by these instead of being compared by their atoms. Paths that
+    share a beginning then share the node objects and their
+    SymbolIdentifiers.
+    """
+    for i in range(1, len(path)):
+        node = path[i]
+        key = (id(path[i - 1]), node.rule_nr, frozenset(node.diff))
+        existing = interned.get(key)
+        if existing is None:
+            interned[key] = node
+        elif existing.reason == node.reason:
+            path[i] = existing
+
+
 def join_paths_with_facts(paths: Collection[nx.DiGraph]) -> nx.DiGraph:
+    """
+    Merge the paths in the given order. Of equal nodes, the one of the first
+    path is kept, so the result only depends on the order of the models.
+    """
     combined = nx.DiGraph()
     for path in paths:
         combined.add_nodes_from(path.nodes(data=True))
@@ -145,7 +510,7 @@ def append_noops(result_graph: nx.DiGraph,
     leaves = list(get_leafs_from_graph(result_graph))
     leaf: Node
     for leaf in leaves:
-        noop_node = Node(frozenset(), next_transformation_id, leaf.atoms)
+        noop_node = Node(frozenset(), next_transformation_id, parent=leaf)
         result_graph.add_edge(leaf,
                               noop_node,
                               transformation=Transformation(
@@ -156,7 +521,9 @@ def build_graph(wrapped_stable_models: List[List[str]],
                 transformed_prg: Collection[AST],
                 sorted_program: List[Transformation],
                 analyzer: ProgramAnalyzer,
-                recursion_transformations_hashes: Set[str]) -> nx.DiGraph:
+                recursion_transformations_hashes: Set[str],
+                workers: int = JUSTIFICATION_WORKERS,
+                batched: bool = JUSTIFICATION_BATCHED) -> nx.DiGraph:
     paths: List[nx.DiGraph] = []
     facts = analyzer.get_facts()
     conflict_free_h = analyzer.get_conflict_free_h()
@@ -170,14 +537,30 @@ def build_graph(wrapped_stable_models: List[List[str]],
         single_node_graph = nx.DiGraph()
         single_node_graph.add_node(fact_node)
         return single_node_graph
-    for model in wrapped_stable_models:
-        h_symbols = get_h_symbols_from_model(model, transformed_prg, facts,
-                                             analyzer.get_constants(),
-                                             conflict_free_h,
-                                             conflict_free_h_showTerm)
+    justification_program = make_justification_program(
+        transformed_prg, facts, analyzer.get_constants(), conflict_free_h)
+    derivations_of_models = get_derivations_of_models_cached(
+        justification_program,
+        wrapped_stable_models,
+        sorted_program,
+        model=analyzer.get_conflict_free_model(),
+        h=conflict_free_h,
+        h_showTerm=conflict_free_h_showTerm,
+        workers=workers,
+        batched=batched)
+    h_symbols_of_models = [
+        select_reasons(derivations, frozenset(facts), conflict_free_h)
+        for derivations in derivations_of_models
+    ]
+    if recursion_transformations_hashes:
+        prefetch_recursion_subgraphs(h_symbols_of_models, mapping, facts,
+                                     recursion_transformations_hashes,
+                                     analyzer, workers)
+    interned: Dict[Tuple, Node] = {}
+    for h_symbols in h_symbols_of_models:
         new_path = make_reason_path_from_facts_to_stable_model(
             mapping, fact_node, h_symbols, recursion_transformations_hashes,
-            conflict_free_h, analyzer)
+            conflict_free_h, analyzer, interned=interned)
         paths.append(new_path)
 
     result_graph = nx.DiGraph()
@@ -205,25 +588,66 @@ def filter_body_aggregates(element: AST):
     return True
 
 
-def get_recursion_subgraph(
-        facts: frozenset, supernode_symbols: frozenset,
-        transformation: Transformation, conflict_free_h: str,
-        analyzer: ProgramAnalyzer) -> List[Node]:
+class RecursionCache:
     """
-    Get a recursion explanation for the given facts and the recursive transformation.
-    Generate graph from explanation, sorted by the iteration step number.
-
-    :param facts: The symbols that were true before the recursive node.
-    :param supernode_symbols: The SymbolIdentifiers of the recursive node.
-    :param transformation: The recursive transformation. An ast object.
-    :param conflict_free_h: The name of the h predicate.
+    Bounded LRU of the h symbols found by the RecursionReasoner, keyed by a
+    content hash of the transformation, the atoms before it and the atoms it
+    derives. A failed analysis is stored as None.
     """
-    init = [fact.symbol for fact in facts]
-    justification_program = ""
-    model_str: str = analyzer.get_conflict_free_model(
-    ) if analyzer else "model"
-    n_str: str = analyzer.get_conflict_free_iterindex() if analyzer else "n"
 
+    def __init__(self, max_entries: int = RECURSION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: str) -> Tuple[bool, Optional[FrozenSet[Symbol]]]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, self._entries[key]
+
+    def put(self, key: str, h_symbols: Optional[FrozenSet[Symbol]]):
+        with self._lock:
+            self._entries[key] = h_symbols
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+recursion_cache = RecursionCache()
+
+
+def make_recursion_key(transformation: Transformation, init: Iterable[Symbol],
+                       derivables: Iterable[Symbol],
+                       analyzer: ProgramAnalyzer) -> str:
+    return hash_parts([
+        transformation.hash,
+        analyzer.get_conflict_free_h(),
+        analyzer.get_conflict_free_model(),
+        analyzer.get_conflict_free_iterindex(),
+        analyzer.get_conflict_free_derivable(),
+        " ".join(sorted(map(str, init))),
+        " ".join(sorted(map(str, derivables))),
+    ])
+
+
+def make_recursion_justification_program(transformation: Transformation,
+                                         analyzer: ProgramAnalyzer) -> str:
     justifier_rules = reify_recursion_transformation(
         transformation,
         h=analyzer.get_conflict_free_h(),
@@ -236,30 +660,110 @@ def get_recursion_subgraph(
         conflict_free_iterindex=analyzer.get_conflict_free_iterindex(),
         conflict_free_derivable=analyzer.get_conflict_free_derivable()
     )
-    justification_program += "\n".join(map(str, justifier_rules))
-    justification_program += f"\n{model_str}(@new())."
+    justification_program = "\n".join(map(str, justifier_rules))
+    justification_program += f"\n{analyzer.get_conflict_free_model()}(@new())."
+    return justification_program
 
-    h_syms = set()
 
+def get_recursion_h_symbols(
+        task: Tuple[str, Sequence[Symbol], FrozenSet[Symbol]],
+        conflict_free_h: str = "h",
+        conflict_free_n: str = "n") -> Optional[FrozenSet[Symbol]]:
+    """
+    Run the RecursionReasoner for a (justification program, atoms before the
+    transformation, atoms derived by it) task. Returns None if the recursion
+    could not be analyzed.
+    """
+    justification_program, init, derivables = task
+    h_syms: Set[Symbol] = set()
     try:
-        RecursionReasoner(init=init,
-                          derivables=supernode_symbols,
+        RecursionReasoner(init=list(init),
+                          derivables=derivables,
                           program=justification_program,
                           callback=h_syms.add,
                           conflict_free_h=conflict_free_h,
-                          conflict_free_n=n_str).main()
+                          conflict_free_n=conflict_free_n).main()
     except RuntimeError:
+        return None
+    return frozenset(h_syms)
+
+
+def prefetch_recursion_subgraphs(h_symbols_of_models: Iterable[Collection[Symbol]],
+                                 rule_mapping: Dict[int, Transformation],
+                                 facts: Collection[Symbol],
+                                 recursive_transformations_hashes: Set[str],
+                                 analyzer: ProgramAnalyzer,
+                                 workers: int = JUSTIFICATION_WORKERS,
+                                 cache: RecursionCache = recursion_cache):
+    """
+    Find the recursive transformations of all paths that are not cached yet,
+    analyze each distinct one once, spread over the workers, and cache the
+    results for get_recursion_subgraph.
+    """
+    tasks: Dict[str, Tuple[str, Tuple[Symbol, ...], FrozenSet[Symbol]]] = {}
+    programs: Dict[str, str] = {}
+    for h_symbols in h_symbols_of_models:
+        diffs: Dict[int, Set[Symbol]] = defaultdict(set)
+        for sym in h_symbols:
+            diffs[sym.arguments[0].number].add(sym.arguments[1])
+        atoms: Set[Symbol] = set(facts)
+        for rule_nr in sorted(rule_mapping.keys()):
+            transformation = rule_mapping[rule_nr]
+            if transformation.hash in recursive_transformations_hashes:
+                key = make_recursion_key(transformation, atoms, diffs[rule_nr], analyzer)
+                if key not in tasks and key not in cache:
+                    if transformation.hash not in programs:
+                        programs[transformation.hash] = \
+                            make_recursion_justification_program(transformation, analyzer)
+                    tasks[key] = (programs[transformation.hash], tuple(atoms),
+                                  frozenset(diffs[rule_nr]))
+            atoms.update(diffs[rule_nr])
+    results = map_models(
+        partial(get_recursion_h_symbols,
+                conflict_free_h=analyzer.get_conflict_free_h(),
+                conflict_free_n=analyzer.get_conflict_free_iterindex()),
+        list(tasks.values()), workers)
+    for key, h_syms in zip(tasks.keys(), results):
+        cache.put(key, h_syms)
+
+
+def get_recursion_subgraph(
+        facts: frozenset, supernode_symbols: frozenset,
+        transformation: Transformation, conflict_free_h: str,
+        analyzer: ProgramAnalyzer) -> List[Node]:
+    """
+    Get a recursion explanation for the given facts and the recursive transformation.
+    Generate graph from explanation, sorted by the iteration step number.
+    The explanations are cached by the content of their inputs.
+
+    :param facts: The symbols that were true before the recursive node.
+    :param supernode_symbols: The SymbolIdentifiers of the recursive node.
+    :param transformation: The recursive transformation. An ast object.
+    :param conflict_free_h: The name of the h predicate.
+    """
+    init = [fact.symbol for fact in facts]
+    derivables = frozenset(s.symbol for s in supernode_symbols)
+    key = make_recursion_key(transformation, init, derivables, analyzer)
+    found, h_syms = recursion_cache.get(key)
+    if not found:
+        h_syms = get_recursion_h_symbols(
+            (make_recursion_justification_program(transformation, analyzer),
+             init, derivables),
+            conflict_free_h=conflict_free_h,
+            conflict_free_n=analyzer.get_conflict_free_iterindex())
+        recursion_cache.put(key, h_syms)
+    if h_syms is None:
         warn(f"Could not analyze recursion for {transformation.rules}")
         return []
 
-    h_syms = collect_h_symbols_and_create_nodes(
+    nodes = collect_h_symbols_and_create_nodes(
         h_syms,
         relevant_indices=[],
         pad=False,
         supernode_symbols=supernode_symbols)
-    if len(h_syms) == 1:
+    if len(nodes) <= 1:
         return []
-    h_syms.sort(key=lambda node: node.rule_nr)
-    insert_atoms_into_nodes(h_syms)
+    nodes.sort(key=lambda node: node.rule_nr)
+    insert_atoms_into_nodes(nodes)
 
-    return h_syms
+    return nodes
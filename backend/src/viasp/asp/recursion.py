@@ -1,4 +1,8 @@
-from clingo import Number, Control
+import time
+
+from clingo import Number, Control, Symbol
+
+from ..shared.defaults import RECURSION_MAX_STEPS, RECURSION_TIMEOUT_SECONDS
 
 
 class RecursionReasoner:
@@ -11,26 +15,45 @@ class RecursionReasoner:
         self.register_h_symbols = kwargs.pop("callback", None)
         self.conflict_free_h = kwargs.pop("conflict_free_h", "h")
         self.conflict_free_n = kwargs.pop("conflict_free_n", "n")
+        self.max_steps = kwargs.pop("max_steps", RECURSION_MAX_STEPS)
+        self.timeout = kwargs.pop("timeout", RECURSION_TIMEOUT_SECONDS)
+        self.step = 0
+        self.step_atoms = []
 
     def new(self):
         return self.atoms
-    
+
     def derivable(self, atom):
         return Number(1) if atom in self.derivables else Number(0)
 
+    def output_atom(self, symbol: Symbol, atom: int):
+        """
+        Observe the atoms as they are grounded. The h facts of the current
+        step are the atoms to add in the next one, so the earlier steps never
+        have to be scanned again.
+        """
+        if not symbol.match(self.conflict_free_h, 3):
+            return
+        self.register_h_symbols(symbol)
+        if atom == 0 and symbol.arguments[0] == Number(self.step):
+            self.step_atoms.append(symbol.arguments[1])
+
     def main(self):
         control = Control()
+        control.register_observer(self)
         control.add("iter", [f"{self.conflict_free_n}"], self.program)
         self.atoms = self.init
+        deadline = time.monotonic() + self.timeout
 
-        step = 1
+        self.step = 1
         while self.atoms != []:
-            control.ground([("iter", [Number(step)])], context=self)
-            self.atoms = [ x.symbol.arguments[1] for x in
-                            control.symbolic_atoms.by_signature(self.conflict_free_h, 3)
-                           if x.is_fact and x.symbol.arguments[0].number == step
-                         ]
-            step += 1
-
-        for x in control.symbolic_atoms.by_signature(self.conflict_free_h, 3):
-            self.register_h_symbols(x.symbol)
+            if self.step > self.max_steps:
+                raise RuntimeError(
+                    f"Recursion did not end within {self.max_steps} steps.")
+            if time.monotonic() > deadline:
+                raise RuntimeError(
+                    f"Recursion did not end within {self.timeout} seconds.")
+            self.step_atoms = []
+            control.ground([("iter", [Number(self.step)])], context=self)
+            self.atoms = self.step_atoms
+            self.step += 1
@@ -1,5 +1,9 @@
-from collections import defaultdict
-from typing import Dict, List, Tuple, Iterable, Set, Collection, Any, Union, Sequence, Optional, cast
+import copy
+import inspect
+import threading
+from collections import defaultdict, OrderedDict
+from hashlib import sha1
+from typing import Callable, Dict, List, Tuple, Iterable, Set, Collection, Any, Union, Sequence, Optional, cast
 
 import clingo
 import networkx as nx
@@ -12,9 +16,8 @@ from clingo.ast import (
     Literal as astLiteral,
     SymbolicAtom as astSymbolicAtom
 )
-from viasp.shared.util import hash_transformation_rules
 
-from .utils import find_index_mapping_for_adjacent_topological_sorts, is_constraint, merge_constraints, topological_sort, filter_body_aggregates
+from .utils import find_index_mapping_for_adjacent_topological_sorts, move_in_index_mapping_for_adjacent_topological_sorts, is_constraint, merge_constraints, topological_sort, filter_body_aggregates
 from ..asp.utils import merge_cycles, remove_loops
 from viasp.asp.ast_types import (
     SUPPORTED_TYPES,
@@ -23,6 +26,9 @@ from viasp.asp.ast_types import (
 )
 from ..shared.model import Transformation, TransformationError, FailedReason, RuleContainer
 from ..shared.simple_logging import error
+from ..shared.util import get_ast_from_input_string
+from ..shared.event import Event, on
+from ..shared.defaults import FACT_BASE_CACHE_MAX_ENTRIES, ANALYSIS_CACHE_MAX_ENTRIES, REIFICATION_CACHE_MAX_ENTRIES
 
 
 def is_fact(rule, dependencies):
@@ -203,6 +209,67 @@ class ProgramAnalyzer(DependencyCollector, FilteredTransformer):
         self.names: Set[str] = set()
         self.temp_names: Set[str] = set()
         self.dependency_graph: Optional[nx.DiGraph] = dependency_graph
+        self.program_hash: Optional[str] = None
+        self._hashable = True
+        self._analysis: Dict[str, Any] = {}
+
+    def copy(self) -> "ProgramAnalyzer":
+        """
+        Return an analyzer that shares the analysis of the program with this
+        one, but keeps its own temporary names.
+        """
+        analyzer = copy.copy(self)
+        analyzer.temp_names = set()
+        return analyzer
+
+    def to_analysis(self) -> Dict[str, Any]:
+        """
+        Return the analysis of the program as plain values, so that it can be
+        stored and turned into an analyzer again with from_analysis. The sort
+        and the recursive rules are only part of it if the program will work.
+        """
+        if self.will_work():
+            self.primary_sort_program_by_dependencies()
+            self.check_positive_recursion()
+        sorted_program, dependency_graph = self._analysis.get(
+            "sorted_program", (None, None))
+        recursion_rules = self._analysis.get("recursion_rules")
+        return {
+            "program_hash": self.program_hash,
+            "names": sorted(self.names),
+            "facts": [f"{fact}." for fact in self.facts],
+            "constants": [str(constant) for constant in self.constants],
+            "pass_through": [str(defined) for defined in self.pass_through],
+            "filtered": [[str(f.ast), f.reason.value] for f in self._filtered],
+            "sorted_program": sorted_program,
+            "dependency_graph": dependency_graph,
+            "recursion_rules": sorted(recursion_rules) if recursion_rules is not None else None,
+        }
+
+    @classmethod
+    def from_analysis(cls, analysis: Dict[str, Any]) -> "ProgramAnalyzer":
+        """
+        Make an analyzer from a stored analysis without visiting the program
+        again. The parts of the program that were filtered keep their text,
+        which is how they are reported as warnings.
+        """
+        analyzer = cls()
+        analyzer.program_hash = analysis["program_hash"]
+        analyzer.names = set(analysis["names"])
+        analyzer.facts = {rule.head for rule in get_ast_from_input_string(tuple(analysis["facts"]))}
+        analyzer.constants = set(get_ast_from_input_string(tuple(analysis["constants"])))
+        analyzer.pass_through = set(get_ast_from_input_string(tuple(analysis["pass_through"])))
+        analyzer._filtered = [
+            TransformationError(ast, FailedReason(reason))
+            for ast, reason in analysis["filtered"]
+        ]
+        if analysis["sorted_program"] is not None:
+            analyzer._analysis["sorted_program"] = (tuple(analysis["sorted_program"]),
+                                                    analysis["dependency_graph"])
+            analyzer.dependency_graph = analysis["dependency_graph"]
+        if analysis["recursion_rules"] is not None:
+            analyzer._analysis["recursion_rules"] = frozenset(analysis["recursion_rules"])
+        return analyzer
 
     def _get_conflict_free_version_of_name(self, name: str) -> str:
         anti_candidates = self.names.union(self.temp_names)
@@ -381,7 +448,7 @@ class ProgramAnalyzer(DependencyCollector, FilteredTransformer):
             **self.visit_children(theory_guard_definition, **kwargs))
 
     def get_facts(self):
-        return extract_symbols(self.facts, self.constants)
+        return extract_symbols(self.facts, self.constants, self.program_hash)
 
     def get_constants(self):
         return list(self.constants)
@@ -467,7 +534,20 @@ class ProgramAnalyzer(DependencyCollector, FilteredTransformer):
     def add_program(
             self,
             program: str,
-            RegisteredTransformer: Optional[Transformer] = None) -> None:
+            RegisteredTransformer: Optional[Transformer] = None,
+            transformer_source: Optional[str] = None) -> None:
+        """
+        Analyze the program, transformed by the registered transformer. The
+        program hash covers the source of the transformer, which is looked up
+        if it is not given. If it cannot be found, the analysis has no hash.
+        """
+        if transformer_source is None:
+            transformer_source = get_transformer_source(RegisteredTransformer)
+        if transformer_source is None:
+            self._hashable = False
+        self.program_hash = AnalysisCache.key(
+            (self.program_hash or "") + program,
+            transformer_source) if self._hashable else None
         if RegisteredTransformer is not None:
             registered_visitor = RegisteredTransformer()  # type: ignore
             new_program: List[AST] = []
@@ -523,6 +603,34 @@ class ProgramAnalyzer(DependencyCollector, FilteredTransformer):
         transformations.sort(key=lambda t: t.id)
         return transformations
 
+    def move_transformation(self, sort: List[Transformation], old_index: int,
+                            new_index: int) -> List[Transformation]:
+        """
+        Return the sort with the transformation at old_index moved to
+        new_index. The bounds of the adjacent sorts are updated from the ones
+        of the given sort instead of being computed again.
+        """
+        if self.dependency_graph is None:
+            raise ValueError(
+                "Dependency graph has not been created yet. Call primary_sort_program_by_dependencies first."
+            )
+        sorted_program = [t.rules for t in sort]
+        moved_item = sorted_program.pop(old_index)
+        sorted_program.insert(new_index, moved_item)
+        index_mapping = {t.id: t.adjacent_sort_indices for t in sort}
+        if old_index < 0 or new_index < 0 or len(index_mapping) != len(sort) or any(
+                len(indices) == 0 for indices in index_mapping.values()):
+            return self.make_transformations_from_sorted_program(sorted_program)
+        adjacency_index_mapping = move_in_index_mapping_for_adjacent_topological_sorts(
+            self.dependency_graph, sorted_program, index_mapping, old_index,
+            new_index)
+        hashes = [t.hash for t in sort]
+        hashes.insert(new_index, hashes.pop(old_index))
+        return [
+            Transformation(i, prg, adjacency_index_mapping[i], hashes[i])
+            for i, prg in enumerate(sorted_program)
+        ]
+
     def make_dependency_graph(
         self,
         head_dependencies: Dict[Tuple[str, int], Set[AST]],
@@ -555,13 +663,15 @@ class ProgramAnalyzer(DependencyCollector, FilteredTransformer):
 
     def primary_sort_program_by_dependencies(
             self) -> List[RuleContainer]:
-        graph = self.make_dependency_graph(self.dependants, self.conditions)
-        graph = merge_constraints(graph)
-        graph, _ = merge_cycles(graph)
-        graph, _ = remove_loops(graph)
-        self.dependency_graph = cast(nx.DiGraph, graph.copy())
-        sorted_program = topological_sort(graph, self.rules)
-        return sorted_program
+        if "sorted_program" not in self._analysis:
+            graph = self.make_dependency_graph(self.dependants, self.conditions)
+            graph = merge_constraints(graph)
+            graph, _ = merge_cycles(graph)
+            graph, _ = remove_loops(graph)
+            dependency_graph = cast(nx.DiGraph, graph.copy())
+            self._analysis["sorted_program"] = (topological_sort(graph, self.rules), dependency_graph)
+        sorted_program, self.dependency_graph = self._analysis["sorted_program"]
+        return list(sorted_program)
 
     def get_index_mapping_for_adjacent_topological_sorts(
         self,
@@ -575,6 +685,11 @@ class ProgramAnalyzer(DependencyCollector, FilteredTransformer):
             self.dependency_graph, sorted_program)
 
     def check_positive_recursion(self) -> Set[str]:
+        if "recursion_rules" not in self._analysis:
+            self._analysis["recursion_rules"] = frozenset(self._check_positive_recursion())
+        return set(self._analysis["recursion_rules"])
+
+    def _check_positive_recursion(self) -> Set[str]:
         positive_dependency_graph = self.make_dependency_graph(self.dependants,
                                            self.positive_conditions)
         positive_dependency_graph = merge_constraints(positive_dependency_graph)
@@ -584,7 +699,7 @@ class ProgramAnalyzer(DependencyCollector, FilteredTransformer):
         recursion_rules = set()
         for t in where1.union(where2):
             if any(not is_constraint(r) for r in t.ast):
-                recursion_rules.add(hash_transformation_rules(t.ast))
+                recursion_rules.add(t.hash)
         return recursion_rules
 
     def should_include_recursive_set(self, recursive_tuple: Tuple[AST, ...]):
@@ -804,6 +919,64 @@ class LiteralWrapper(Transformer):
         return ast.Literal(literal.location, ast.Sign.NoSign, wrap_atm)
 
 
+class ModelIndexWrapper(Transformer):
+    """
+    Rewrites every atom ``a`` of a rule into ``model(M, a)`` and restricts
+    the rule to ``model(M)``, so that a single grounding covers several
+    stable models told apart by their index ``M``. Only rules are rewritten,
+    the index would be unbound in any other statement.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.wrap_str: str = kwargs.pop("wrap_str", "model")
+        self.index_variable: str = "M"
+        self.names: Set[str] = set()
+        self.in_rule = False
+        super().__init__(*args, **kwargs)
+
+    def wrap(self, statement: AST) -> AST:
+        """
+        Rewrite a rule. Program statements are kept as they are, any other
+        statement raises a ValueError.
+        """
+        if statement.ast_type == ASTType.Program:
+            return statement
+        if statement.ast_type != ASTType.Rule:
+            raise ValueError(f"Cannot index the statement {statement} by model.")
+        return self.visit(statement)
+
+    def visit_Rule(self, rule: ast.Rule) -> ast.Rule:  # type: ignore
+        self.names = set()
+        self.visit_children(rule, collect=True)
+        self.index_variable = "M"
+        while self.index_variable in self.names:
+            self.index_variable = f"{self.index_variable}_"
+        self.in_rule = True
+        try:
+            rule = rule.update(**self.visit_children(rule))
+        finally:
+            self.in_rule = False
+        loc = rule.location
+        index_fun = ast.Function(
+            loc, self.wrap_str, [ast.Variable(loc, self.index_variable)], 0)
+        index_lit = ast.Literal(loc, ast.Sign.NoSign,
+                                ast.SymbolicAtom(index_fun))
+        return rule.update(body=[index_lit, *rule.body])
+
+    def visit_Variable(self, variable: ast.Variable, **kwargs: Any) -> AST:  # type: ignore
+        self.names.add(variable.name)
+        return variable
+
+    def visit_SymbolicAtom(self, atom: ast.SymbolicAtom, **kwargs: Any) -> AST:  # type: ignore
+        if kwargs.get("collect", False) or not self.in_rule:
+            return atom.update(**self.visit_children(atom, **kwargs))
+        loc = atom.symbol.location
+        return ast.SymbolicAtom(
+            ast.Function(loc, self.wrap_str,
+                         [ast.Variable(loc, self.index_variable), atom.symbol],
+                         0))
+
+
 class ProgramReifierForRecursions(ProgramReifier):
 
     def __init__(self, *args, **kwargs):
@@ -888,33 +1061,260 @@ def transform(program: str, visitor=None, **kwargs):
     return rulez
 
 
-def reify(transformation: Transformation, **kwargs):
-    visitor = ProgramReifier(transformation.id, **kwargs)
+class ReificationCache:
+    """
+    Bounded LRU of the reified rules of transformations, keyed by the encoding,
+    the transformation hash, the rule number and the conflict free names used.
+    The entries of an encoding are dropped whenever its program or its
+    registered transformer changes.
+    """
+
+    def __init__(self, max_entries: int = REIFICATION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(encoding_id: str, transformation: Transformation,
+            rule_nr: Optional[int], kwargs: Dict[str, Any]) -> Tuple:
+        names = tuple(sorted((k, v) for k, v in kwargs.items() if isinstance(v, str)))
+        return (encoding_id, transformation.hash, rule_nr, names,
+                "get_conflict_free_variable" in kwargs)
+
+    def get(self, key: Tuple) -> Optional[List[AST]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry)
+
+    def put(self, key: Tuple, reified: List[AST]):
+        with self._lock:
+            self._entries[key] = tuple(reified)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_encoding(self, encoding_id: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == encoding_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+reification_cache = ReificationCache()
+
+
+@on(Event.PROGRAM_CHANGED)
+@on(Event.TRANSFORMER_CHANGED)
+def invalidate_reifications(encoding_id: str, **_):
+    reification_cache.invalidate_encoding(encoding_id)
+
+
+def reify(transformation: Transformation, encoding_id: Optional[str] = None, **kwargs):
+    return reify_cached(encoding_id, transformation, transformation.id, kwargs,
+                        lambda: ProgramReifier(transformation.id, **kwargs))
+
+
+def reify_cached(encoding_id: Optional[str], transformation: Transformation,
+                 rule_nr: Optional[int], kwargs: Dict[str, Any],
+                 make_visitor: Callable[[], Transformer]) -> List[AST]:
+    """
+    Reify the rules of the transformation with a visitor from make_visitor.
+    The result is only cached if the encoding it belongs to is given.
+    """
+    key = None if encoding_id is None else ReificationCache.key(
+        encoding_id, transformation, rule_nr, kwargs)
+    if key is not None:
+        cached = reification_cache.get(key)
+        if cached is not None:
+            return cached
+    visitor = make_visitor()
     result: List[AST] = []
     for rule in transformation.rules.ast:
         result.extend(cast(Iterable[AST], visitor.visit(rule)))
+    if key is not None:
+        reification_cache.put(key, result)
     return result
 
 
 def reify_list(transformations: Iterable[Transformation],
+               encoding_id: Optional[str] = None,
                **kwargs) -> List[AST]:
     reified = []
     for part in transformations:
-        reified.extend(reify(part, **kwargs))
+        reified.extend(reify(part, encoding_id, **kwargs))
     return reified
 
 
-def extract_symbols(facts, constants=None):
+class FactBaseCache:
+    """
+    Bounded LRU of ground fact bases, keyed by the hash of the program they
+    come from. An encoding's fact base is only grounded again when its
+    program changes.
+    """
+
+    def __init__(self, max_entries: int = FACT_BASE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Symbol, ...]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, symbols: Tuple[Symbol, ...]):
+        with self._lock:
+            self._entries[key] = symbols
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+fact_base_cache = FactBaseCache()
+
+
+class AnalysisCache:
+    """
+    Bounded LRU of program analyzers, keyed by a hash of the program and the
+    source of the registered transformer. A program is only parsed and
+    analyzed again when it or its transformer changes.
+    """
+
+    def __init__(self, max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(program: str, transformer_source: str) -> str:
+        hash_object = sha1(program.encode())
+        hash_object.update(b"\0")
+        hash_object.update(transformer_source.encode())
+        return hash_object.hexdigest()
+
+    @staticmethod
+    def store_key(program: str, transformer_source: str) -> Tuple[str, str]:
+        """
+        Return the hashes of the program and of the transformer, under which
+        the analysis is stored in the database.
+        """
+        return sha1(program.encode()).hexdigest(), sha1(
+            transformer_source.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[ProgramAnalyzer]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, analyzer: ProgramAnalyzer):
+        with self._lock:
+            self._entries[key] = analyzer
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+analysis_cache = AnalysisCache()
+
+
+def get_transformer_source(transformer: Optional[Transformer]) -> Optional[str]:
+    """
+    Return the source of the transformer class, an empty string without a
+    transformer, or None if the source cannot be found.
+    """
+    if transformer is None:
+        return ""
+    try:
+        return inspect.getsource(cast(type, transformer))
+    except (OSError, TypeError):
+        return None
+
+
+def analyze_program(
+        program: str,
+        transformer_source: str,
+        load_transformer: Callable[[], Optional[Transformer]],
+        load_analysis: Optional[Callable[[str, str], Optional[Dict[str, Any]]]] = None,
+        save_analysis: Optional[Callable[[str, str, Dict[str, Any]], None]] = None
+) -> ProgramAnalyzer:
+    """
+    Return an analyzer of the program with the registered transformer. The
+    in-memory cache is asked first, then the stored analyses, which are kept
+    by the hashes of the program and the transformer. The transformer is only
+    loaded if the program was not analyzed before.
+    """
+    key = AnalysisCache.key(program, transformer_source)
+    analyzer = analysis_cache.get(key)
+    if analyzer is None:
+        program_hash, transformer_hash = AnalysisCache.store_key(
+            program, transformer_source)
+        analysis = load_analysis(program_hash, transformer_hash) if load_analysis is not None else None
+        if analysis is not None:
+            analyzer = ProgramAnalyzer.from_analysis(analysis)
+        else:
+            analyzer = ProgramAnalyzer()
+            analyzer.add_program(program, load_transformer(), transformer_source)
+            if save_analysis is not None:
+                save_analysis(program_hash, transformer_hash, analyzer.to_analysis())
+        analysis_cache.put(key, analyzer)
+    return analyzer.copy()
+
+
+def extract_symbols(facts, constants=None, program_hash: Optional[str] = None):
+    """
+    Ground the facts and constants. The result is cached under the hash of the
+    program they come from, if it is given.
+    """
     if constants is None:
         constants = set()
-    ctl = clingo.Control()
-    ctl.add("INTERNAL", [], "".join(f"{str(f)}." for f in facts))
-    ctl.add("INTERNAL", [], "".join(f"{str(c)}" for c in constants))
-    ctl.ground([("INTERNAL", [])])
-    result = []
-    for fact in ctl.symbolic_atoms:
-        result.append(fact.symbol)
-    return result
+    symbols = fact_base_cache.get(program_hash) if program_hash is not None else None
+    if symbols is None:
+        ctl = clingo.Control()
+        ctl.add("INTERNAL", [], "".join(f"{str(f)}." for f in facts))
+        ctl.add("INTERNAL", [], "".join(f"{str(c)}" for c in constants))
+        ctl.ground([("INTERNAL", [])])
+        symbols = tuple(fact.symbol for fact in ctl.symbolic_atoms)
+        if program_hash is not None:
+            fact_base_cache.put(program_hash, symbols)
+    return list(symbols)
 
 
 def has_an_interval(literal: ast.Literal) -> bool:  # type: ignore
@@ -932,12 +1332,10 @@ def has_an_interval(literal: ast.Literal) -> bool:  # type: ignore
 
 
 def reify_recursion_transformation(transformation: Transformation,
+                                   encoding_id: Optional[str] = None,
                                    **kwargs) -> List[AST]:
-    visitor = ProgramReifierForRecursions(**kwargs)
-    result: List[AST] = []
-    for rule in transformation.rules.ast:
-        result.extend(cast(Iterable[AST], visitor.visit(rule)))
-    return result
+    return reify_cached(encoding_id, transformation, None, kwargs,
+                        lambda: ProgramReifierForRecursions(**kwargs))
 
 
 class LiteralsCollector(Transformer):
@@ -85,10 +85,15 @@ BOB_THE_BUILDER = ClingoReconstructor()
 
 
 def apply_multiple(calls: Sequence[ClingoMethodCall], ctl: Optional[Control] = None) -> Control:
+    """
+    Replay the calls on the control. The program parts they store are
+    written in one transaction.
+    """
     if ctl is None:
         ctl = Control()
-    for call in calls:
-        ctl = apply(call, ctl)
+    with get_database().transaction():
+        for call in calls:
+            ctl = apply(call, ctl)
     return ctl
 
 
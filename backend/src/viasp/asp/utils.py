@@ -1,13 +1,16 @@
 """Mostly graph utility functions."""
+from collections import defaultdict
+from heapq import heappush, heappop
+from itertools import count
+
 import networkx as nx
 from clingo import Symbol, ast
 from clingo.ast import ASTType, AST
-from typing import Generator, List, Sequence, Tuple, Dict, Set, FrozenSet, Optional
+from typing import Generator, List, Sequence, Tuple, Dict, Set, FrozenSet, Optional, Iterable
 
 from ..shared.simple_logging import warn
 from ..shared.model import Node, SymbolIdentifier, Transformation, RuleContainer
 from ..shared.util import pairwise, get_root_node_from_graph, hash_from_sorted_transformations
-from ..server.database import insert_graph_relation
 
 def is_constraint(rule: AST) -> bool:
     return rule.ast_type == ASTType.Rule and "atom" in rule.head.child_keys and rule.head.atom.ast_type == ASTType.BooleanConstant  # type: ignore
@@ -62,17 +65,16 @@ def remove_loops(g: nx.DiGraph) -> Tuple[nx.DiGraph, FrozenSet[RuleContainer]]:
 
 
 def insert_atoms_into_nodes(path: List[Node]) -> None:
+    """
+    Link every node of the path to its predecessor. The atoms of a node are
+    then derived from its diff and the atoms of its predecessor when needed.
+    """
     if not path:
         return
     facts = path[0]
-    state = set(facts.diff)
-    facts.atoms = frozenset(state)
-    state = set(map(SymbolIdentifier, (s.symbol for s in state)))
+    facts.atoms = frozenset(facts.diff)
     for u, v in pairwise(path):
-        state.update(v.diff)
-        state.update(u.diff)
-        v.atoms = frozenset(state)
-        state = set(map(SymbolIdentifier, (s.symbol for s in state)))
+        v.parent = u
 
 
 def identify_reasons(g: nx.DiGraph) -> None:
@@ -81,91 +83,77 @@ def identify_reasons(g: nx.DiGraph) -> None:
     Takes the Symbol from node.reason and overwrites the values of the Dict node.reason
     with the SymbolIdentifier of the corresponding symbol.
 
+    A reason is resolved at the closest node along the first predecessors
+    that derives it. The graph is traversed top-down along these edges while
+    keeping a map from symbols to the SymbolIdentifiers of the current path,
+    so that every reason is looked up in constant time.
+
     :param g: The graph to identify the reasons for.
     """
-    # get fact node:
-    root_node = get_root_node_from_graph(g)
-
-    # go through entire graph, starting at root_node and traveling down the graph via successors
-    children_next = set()
-    searched_nodes = set()
-    children_current = [root_node]
-    while len(children_current) != 0:
-        for v in children_current:
-            for new, rr in v.reason.items():
-                tmp_reason = []
-                for r in rr:
-                    tmp_reason.append(get_identifiable_reason(g, v, r))
-                v.reason[str(new)] = tmp_reason
+    children: Dict[Node, List[Node]] = defaultdict(list)
+    roots: List[Node] = []
+    for v in g.nodes:
+        parent = next(iter(g.predecessors(v)), None)
+        if parent is None:
+            roots.append(v)
+        else:
+            children[parent].append(v)
+
+    path: Dict[Symbol, SymbolIdentifier] = {}
+    for root in roots:
+        # stack of (node, undo log); a None node restores the path
+        stack: List[Tuple[Optional[Node], List]] = [(root, [])]
+        while stack:
+            v, undo = stack.pop()
+            if v is None:
+                restore_path(path, undo)
+                continue
+            undo = extend_path(path, v.diff)
+            stack.append((None, undo))
+            identify_reasons_of_node(v, path)
+            recursive_undo: List = []
             for node in v.recursive:
-                for new, rr in node.reason.items():
-                    tmp_reason = []
-                    for r in rr:
-                        tmp_reason.append(
-                            get_identifiable_reason_of_recursive_subnode(v.recursive,
-                                                    node,
-                                                    r,
-                                                    g,
-                                                    v))
-                    node.reason[str(new)] = tmp_reason
+                recursive_undo.extend(extend_path(path, node.diff))
+                identify_reasons_of_node(node, path)
+            restore_path(path, recursive_undo)
             for s in v.diff:
                 if str(s.symbol) in v.reason.keys() and len(v.reason[str(
                         s.symbol)]) > 0:
                     s.has_reason = True
-            searched_nodes.add(v)
-            for w in g.successors(v):
-                children_next.add(w)
-            children_next = children_next.difference(searched_nodes)
-        children_current = list(children_next)
+            stack.extend((w, []) for w in reversed(children[v]))
 
 
-def get_identifiable_reason(g: nx.DiGraph,
-                            v: Node,
-                            r: Symbol,
-                            super_graph=None,
-                            super_node=None) -> Optional[SymbolIdentifier]:
+def extend_path(path: Dict[Symbol, SymbolIdentifier],
+                symbols: Iterable[SymbolIdentifier]) -> List:
     """
-    Returns the SymbolIdentifier that is the reason for the given Symbol r.
-    If the reason is not in the node, it returns recursively calls itself with the predecessor.
-    
-    
-    :param g: The graph that contains the nodes
-    :param v: The node that contains the symbol r
-    :param r: The symbol that is the reason
+    Add the symbols to the path and return what is needed to undo it.
     """
-    if (r in v.diff): return next(s for s in v.atoms if s == r)
-    if (g.in_degree(v) != 0):
-        for u in g.predecessors(v):
-            return get_identifiable_reason(g,
-                                           u,
-                                           r,
-                                           super_graph=super_graph,
-                                           super_node=super_node)
-    if (super_graph != None and super_node != None):
-        return get_identifiable_reason(super_graph, super_node, r)
-
-    # stop criterion: v is the root node and there is no super_graph
-    warn(f"An explanation could not be made")
-    return None
-
-def get_identifiable_reason_of_recursive_subnode(recursive_subgraph: List[Node],
-                                                 v: Node,
-                                                 r: Symbol,
-                                                 super_graph,
-                                                 super_node) -> Optional[SymbolIdentifier]:
-    if (r in v.diff): return next(s for s in v.atoms if s == r)
-    if (recursive_subgraph.index(v) != 0):
-        return get_identifiable_reason_of_recursive_subnode(recursive_subgraph, 
-                                                            recursive_subgraph[recursive_subgraph.index(v)-1],
-                                                            r,
-                                                            super_graph,
-                                                            super_node)
-    if (super_graph != None and super_node != None):
-        return get_identifiable_reason(super_graph, super_node, r)
-    
-    # stop criterion: v is the root node and there is no super_graph
-    warn(f"An explanation could not be made")
-    return None
+    undo = []
+    for s in symbols:
+        undo.append((s.symbol, path.get(s.symbol)))
+        path[s.symbol] = s
+    return undo
+
+
+def restore_path(path: Dict[Symbol, SymbolIdentifier], undo: List) -> None:
+    for symbol, previous in reversed(undo):
+        if previous is None:
+            del path[symbol]
+        else:
+            path[symbol] = previous
+
+
+def identify_reasons_of_node(v: Node,
+                             path: Dict[Symbol, SymbolIdentifier]) -> None:
+    for new, rr in list(v.reason.items()):
+        tmp_reason = []
+        for r in rr:
+            identifiable = path.get(getattr(r, "symbol", r))
+            if identifiable is None:
+                warn(f"An explanation could not be made")
+            tmp_reason.append(identifiable)
+        v.reason[str(new)] = tmp_reason
+
 
 def calculate_spacing_factor(g: nx.DiGraph) -> None:
     """
@@ -200,34 +188,38 @@ def topological_sort(g: nx.DiGraph, rules: Sequence[ast.Rule]) -> List:  # type:
         If the order is ambiguous, prefer the order of the rules.
         Note: Rule = Node
 
+        Kahn's algorithm, where the nodes without incoming edges wait in a
+        heap keyed by the position of their earliest rule.
+
         :param g: Graph
         :param rules: List of Rules
     """
-    sorted: List = []  # L list of the sorted elements
-    no_incoming_edge = set()  # set of all nodes with no incoming edges
+    positions: Dict[AST, int] = {}
+    for i, rule in enumerate(rules):
+        positions.setdefault(rule, i)
+
+    def position(node) -> int:
+        return min((positions.get(rule, len(rules)) for rule in node.ast),
+                   default=len(rules))
 
-    no_incoming_edge.update(
-        [node for node in g.nodes if g.in_degree(node) == 0])
+    sorted: List = []  # L list of the sorted elements
+    in_degree = dict(g.in_degree())
+    no_incoming_edge: List[Tuple[int, int, RuleContainer]] = []  # heap of all nodes with no incoming edges
+    tie_breaker = count()
+    for node, degree in in_degree.items():
+        if degree == 0:
+            heappush(no_incoming_edge, (position(node), next(tie_breaker), node))
     while len(no_incoming_edge):
-        earliest_node_index = len(rules)
-        earliest_node = None
-        for node in no_incoming_edge:
-            for rule in node.ast:
-                node_index = rules.index(rule)
-                if node_index < earliest_node_index:
-                    earliest_node_index = node_index
-                    earliest_node = node
-
-        no_incoming_edge.remove(earliest_node)
+        _, _, earliest_node = heappop(no_incoming_edge)
         sorted.append(earliest_node)
 
-        # update graph
-        for node in list(g.successors(earliest_node)):
-            g.remove_edge(earliest_node, node)
-            if g.in_degree(node) == 0:
-                no_incoming_edge.add(node)
+        # update in-degrees
+        for node in g.successors(earliest_node):
+            in_degree[node] -= 1
+            if in_degree[node] == 0:
+                heappush(no_incoming_edge, (position(node), next(tie_breaker), node))
 
-    if len(g.edges):
+    if len(sorted) != len(g.nodes):
         warn("Could not sort the graph.")
         raise Exception("Could not sort the graph.")
     return sorted
@@ -236,25 +228,46 @@ def topological_sort(g: nx.DiGraph, rules: Sequence[ast.Rule]) -> List:  # type:
 def find_index_mapping_for_adjacent_topological_sorts(
     g: nx.DiGraph,
     sorted_program: List[RuleContainer]) -> Dict[int, Dict[str, int]]:
-    new_indices: Dict[int, Dict[str, int]] = {}
-    for i, rule_container in enumerate(sorted_program):
-        lower_bound = max([sorted_program.index(u) for u in g.predecessors(rule_container)]+[-1])
-        upper_bound = min([sorted_program.index(u) for u in g.successors(rule_container)]+[len(sorted_program)])
-        new_indices[i] = {"lower_bound": lower_bound+1, "upper_bound": upper_bound-1}
-    return new_indices
+    positions = {rule_container: i for i, rule_container in enumerate(sorted_program)}
+    return {
+        i: get_adjacent_sort_bounds(g, rule_container, positions)
+        for i, rule_container in enumerate(sorted_program)
+    }
 
 
-def register_adjacent_sorts(primary_sort: List[Transformation], primary_hash: str) -> None:
-    for transformation in primary_sort:
-        for new_index in range(transformation.adjacent_sort_indices["lower_bound"], transformation.adjacent_sort_indices["upper_bound"]+1):
-            if new_index == transformation.id:
-                continue
-            new_sort_rules = [t.rules for t in primary_sort]
-            new_sort_rules.remove(transformation.rules)
-            new_sort_rules.insert(new_index, transformation.rules)
-            new_sort_transformations = [Transformation(id=i, rules=rules) for i, rules in enumerate(new_sort_rules)]
-            new_hash = hash_from_sorted_transformations(new_sort_transformations)
-            insert_graph_relation(primary_hash, new_hash, new_sort_transformations)
+def get_adjacent_sort_bounds(
+        g: nx.DiGraph, rule_container: RuleContainer,
+        positions: Dict[RuleContainer, int]) -> Dict[str, int]:
+    """
+    Return the range of indices the rule container can be moved to without
+    passing one of its dependencies.
+    """
+    lower_bound = max([positions[u] for u in g.predecessors(rule_container)]+[-1])
+    upper_bound = min([positions[u] for u in g.successors(rule_container)]+[len(positions)])
+    return {"lower_bound": lower_bound+1, "upper_bound": upper_bound-1}
+
+
+def move_in_index_mapping_for_adjacent_topological_sorts(
+        g: nx.DiGraph, sorted_program: List[RuleContainer],
+        index_mapping: Dict[int, Dict[str, int]], old_index: int,
+        new_index: int) -> Dict[int, Dict[str, int]]:
+    """
+    Update the index mapping of a sort after the rule container at old_index
+    was moved to new_index. sorted_program is the sort after the move. Only
+    the bounds of the shifted rule containers and of their neighbours change.
+    """
+    positions = {rule_container: i for i, rule_container in enumerate(sorted_program)}
+    first, last = min(old_index, new_index), max(old_index, new_index)
+    shifted = sorted_program[first:last+1]
+    changed = set(shifted)
+    for rule_container in shifted:
+        changed.update(g.predecessors(rule_container))
+        changed.update(g.successors(rule_container))
+    new_indices = dict(index_mapping)
+    for rule_container in changed:
+        new_indices[positions[rule_container]] = get_adjacent_sort_bounds(
+            g, rule_container, positions)
+    return new_indices
 
 
 def recalculate_transformation_ids(sort: List[Transformation]):
@@ -2,7 +2,7 @@ import json
 from typing import Collection
 
 import requests
-from .shared.defaults import DEFAULT_BACKEND_URL
+from .shared.defaults import DEFAULT_BACKEND_URL, ENCODING_ID_HEADER
 from .shared.io import DataclassJSONEncoder
 from .shared.model import ClingoMethodCall, StableModel, TransformerTransport
 from .shared.interfaces import ViaspClient
@@ -28,6 +28,9 @@ class ClingoClient(ViaspClient):
             self.backend_url = kwargs["viasp_backend_url"]
         else:
             self.backend_url = DEFAULT_BACKEND_URL
+        self.headers = {'Content-Type': 'application/json'}
+        if "viasp_encoding_id" in kwargs:
+            self.headers[ENCODING_ID_HEADER] = kwargs["viasp_encoding_id"]
         if not backend_is_running(self.backend_url):
             log(f"Backend is unavailable at ({self.backend_url})", Level.WARN)
 
@@ -43,7 +46,7 @@ class ClingoClient(ViaspClient):
             serialized = json.dumps(call, cls=DataclassJSONEncoder)
             r = requests.post(f"{self.backend_url}/control/add_call",
                               data=serialized,
-                              headers={'Content-Type': 'application/json'})
+                              headers=self.headers)
             if not r.ok:
                 error(f"{r.status_code} {r.reason}")
         else:
@@ -53,7 +56,7 @@ class ClingoClient(ViaspClient):
         serialized = json.dumps(stable_models, cls=DataclassJSONEncoder)
         r = requests.post(f"{self.backend_url}/control/models",
                           data=serialized,
-                          headers={'Content-Type': 'application/json'})
+                          headers=self.headers)
         if r.ok:
             log(f"Set models.")
         else:
@@ -61,14 +64,16 @@ class ClingoClient(ViaspClient):
 
     def show(self):
         self._reconstruct()
-        r = requests.post(f"{self.backend_url}/control/show")
+        r = requests.post(f"{self.backend_url}/control/show",
+                          headers=self.headers)
         if r.ok:
             log(f"Drawing in progress.")
         else:
             error(f"Drawing failed [{r.status_code}] ({r.text})")
 
     def _reconstruct(self):
-        r = requests.get(f"{self.backend_url}/control/reconstruct")
+        r = requests.get(f"{self.backend_url}/control/reconstruct",
+                         headers=self.headers)
         if r.ok:
             log(f"Reconstructing in progress.")
         else:
@@ -83,7 +88,7 @@ class ClingoClient(ViaspClient):
                                 cls=DataclassJSONEncoder)
         r = requests.post(f"{self.backend_url}/control/relax",
                           data=serialized,
-                          headers={'Content-Type': 'application/json'})
+                          headers=self.headers)
         if r.ok:
             log(f"Successfully transformed program constraints.")
             return '\n'.join(r.json())
@@ -111,7 +116,7 @@ class ClingoClient(ViaspClient):
 
         r = requests.post(f"{self.backend_url}/control/clingraph",
                           data=serialized,
-                          headers={'Content-Type': 'application/json'})
+                          headers=self.headers)
         if r.ok:
             log(f"Clingraph visualization in progress.")
         else:
@@ -126,7 +131,7 @@ class ClingoClient(ViaspClient):
                                 cls=DataclassJSONEncoder)
         r = requests.post(f"{self.backend_url}/control/add_transformer",
                           data=serialized,
-                          headers={'Content-Type': 'application/json'})
+                          headers=self.headers)
         if r.ok:
             log(f"Transformer registered.")
         else:
@@ -138,6 +143,6 @@ class ClingoClient(ViaspClient):
         serializable_warning = json.dumps([warning], cls=DataclassJSONEncoder)
         r = requests.post(f"{self.backend_url}/control/warnings",
                           data=serializable_warning,
-                          headers={'Content-Type': 'application/json'})
+                          headers=self.headers)
         if not r.ok:
             error(f"Registering warning failed [{r.status_code}] ({r.text})")
\ No newline at end of file
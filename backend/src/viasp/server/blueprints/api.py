@@ -3,45 +3,104 @@ from typing import Tuple, Any, Dict, Iterable, Optional, List
 from flask import request, Blueprint, jsonify, abort, Response
 from uuid import uuid4
 from time import time
+import threading
 
 from clingo import Control
 from clingraph.orm import Factbase
 from clingraph.graphviz import compute_graphs, render
 
-from .dag_api import generate_graph, set_current_graph, wrap_marked_models, \
+from .dag_api import generate_graph, load_analyzer, set_current_graph, wrap_marked_models, \
         load_program, load_transformer, load_models, \
         load_clingraph_names
-from ..database import CallCenter, get_database, insert_graph_relation, save_dependency_graph, save_recursive_transformations_hashes, set_models, clear_models, save_many_sorts, save_sort, save_clingraph, clear_clingraph, save_transformer, save_warnings, clear_warnings, load_warnings, save_warnings, clear_all_sorts
+from ..database import CallCenter, get_database, insert_graph_relation, save_dependency_graph, save_recursive_transformations_hashes, set_models, clear_models, save_many_sorts, save_sort, save_clingraph, clear_clingraph, save_transformer, save_warnings, clear_warnings, load_warnings, save_warnings, clear_all_sorts, transaction, get_or_create_encoding_id
 from ...asp.reify import ProgramAnalyzer
 from ...asp.relax import ProgramRelaxer, relax_constraints
 from ...shared.model import ClingoMethodCall, StableModel, Transformation, TransformerTransport
 from ...shared.util import hash_from_sorted_transformations
-from ...asp.utils import register_adjacent_sorts
-from ...shared.defaults import CLINGRAPH_PATH, SORTGENERATION_BATCH_SIZE, SORTGENERATION_TIMEOUT_SECONDS
+from ...shared.defaults import CLINGRAPH_PATH, SORTGENERATION_BATCH_SIZE, SORTGENERATION_TIMEOUT_SECONDS, ENCODING_ID_COOKIE, \
+    DEFAULT_ENCODING_ID, SESSION_TIMEOUT_SECONDS
 from ...asp.replayer import apply_multiple
 
 bp = Blueprint("api", __name__, template_folder='../templates/')
 
-calls = CallCenter()
-ctl: Optional[Control] = None
 using_clingraph: List[str] = []
 
 
+class ControlSession:
+    """
+    The registered calls and the reconstructed Control of one encoding.
+    Requests of the same session are serialized by its lock, different
+    sessions are handled concurrently.
+    """
+
+    def __init__(self):
+        self.calls = CallCenter()
+        self.ctl: Optional[Control] = None
+        self.lock = threading.RLock()
+        self.last_used = time()
+
+    def close(self):
+        self.calls.close()
+        self.ctl = None
+
+
+sessions: Dict[str, ControlSession] = {}
+sessions_lock = threading.Lock()
+
+
+def get_session() -> ControlSession:
+    encoding_id = get_or_create_encoding_id()
+    with sessions_lock:
+        expire_sessions()
+        if encoding_id not in sessions:
+            sessions[encoding_id] = ControlSession()
+        session = sessions[encoding_id]
+        session.last_used = time()
+        return session
+
+
+def expire_sessions(timeout: float = SESSION_TIMEOUT_SECONDS) -> None:
+    """
+    Remove the sessions that were not used within the timeout. The session
+    of the default encoding is kept.
+    """
+    now = time()
+    for encoding_id in [
+            encoding_id for encoding_id, session in sessions.items()
+            if encoding_id != DEFAULT_ENCODING_ID and now - session.last_used > timeout
+    ]:
+        sessions.pop(encoding_id).close()
+
+
 def handle_call_received(call: ClingoMethodCall) -> None:
-    global ctl
-    calls.append(call)
-    if ctl is not None:
-        ctl = apply_multiple(calls.get_pending(), ctl)
+    session = get_session()
+    with session.lock:
+        session.calls.append(call)
+        if session.ctl is not None:
+            session.ctl = apply_multiple(session.calls.get_pending(),
+                                         session.ctl)
 
 
 def handle_calls_received(calls: Iterable[ClingoMethodCall]) -> None:
-    for call in calls:
-        handle_call_received(call)
+    session = get_session()
+    with session.lock:
+        session.calls.extend(list(calls))
+        if session.ctl is not None:
+            session.ctl = apply_multiple(session.calls.get_pending(),
+                                         session.ctl)
+
+
+@bp.route("/control/session", methods=["POST"])
+def create_session():
+    encoding_id = uuid4().hex
+    response = jsonify({"encoding_id": encoding_id})
+    response.set_cookie(ENCODING_ID_COOKIE, encoding_id)
+    return response
 
 
 @bp.route("/control/calls", methods=["GET"])
 def get_calls():
-    return jsonify(calls.get_all())
+    return jsonify(get_session().calls.get_all())
 
 
 @bp.route("/control/program", methods=["GET"])
@@ -76,9 +135,11 @@ def get_by_name_or_index_from_args_or_kwargs(name: str, index: int, *args:
 
 @bp.route("/control/reconstruct", methods=["GET"])
 def reconstruct():
-    if calls:
-        global ctl
-        ctl = apply_multiple(calls.get_pending(), ctl)
+    session = get_session()
+    with session.lock:
+        if session.calls:
+            session.ctl = apply_multiple(session.calls.get_pending(),
+                                         session.ctl)
     return "ok"
 
 
@@ -104,9 +165,10 @@ def set_stable_models():
 @bp.route("/control/models/clear", methods=["POST"])
 def models_clear():
     if request.method == "POST":
-        clear_models()
-        global ctl
-        ctl = None
+        session = get_session()
+        with session.lock:
+            clear_models()
+            session.ctl = None
     return "ok"
 
 
@@ -140,7 +202,6 @@ def set_warnings():
 def set_primary_sort(analyzer: ProgramAnalyzer):
     primary_sort = analyzer.get_sorted_program()
     primary_hash = hash_from_sorted_transformations(primary_sort)
-    register_adjacent_sorts(primary_sort, primary_hash)
     try:
         _ = set_current_graph(primary_hash)
     except KeyError:
@@ -160,17 +221,19 @@ def save_analyzer_values(analyzer: ProgramAnalyzer):
 @bp.route("/control/show", methods=["POST"])
 def show_selected_models():
     try:
-        analyzer = ProgramAnalyzer()
-        analyzer.add_program(load_program(), load_transformer())
-        save_warnings(analyzer.get_filtered())
-
-        marked_models = load_models()
-        marked_models = wrap_marked_models(marked_models,
-                                        analyzer.get_conflict_free_showTerm())
-        if analyzer.will_work():
-            save_recursive_transformations_hashes(analyzer.check_positive_recursion())
-            set_primary_sort(analyzer)
-            save_analyzer_values(analyzer)
+        with get_session().lock:
+            analyzer = load_analyzer()
+            marked_models = load_models()
+            marked_models = wrap_marked_models(marked_models,
+                                            analyzer.get_conflict_free_showTerm())
+            if analyzer.will_work():
+                analyzer.get_sorted_program()
+            with transaction():
+                save_warnings(analyzer.get_filtered())
+                if analyzer.will_work():
+                    save_analyzer_values(analyzer)
+            if analyzer.will_work():
+                set_primary_sort(analyzer)
     except Exception as e:
         return str(e), 500
     return "ok", 200
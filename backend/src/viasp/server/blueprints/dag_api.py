@@ -8,14 +8,13 @@ import numpy as np
 from flask import Blueprint, current_app, request, jsonify, abort, Response, send_file, session
 from clingo.ast import AST
 
-from ...asp.reify import ProgramAnalyzer, reify_list
+from ...asp.reify import ProgramAnalyzer, analyze_program, reify_list
 from ...asp.justify import build_graph
 from ...shared.defaults import STATIC_PATH
 from ...shared.model import Transformation, Node, Signature
 from ...shared.util import get_start_node_from_graph, is_recursive, hash_from_sorted_transformations, pairwise
-from ...asp.utils import register_adjacent_sorts
 from ...shared.io import StableModel
-from ..database import load_recursive_transformations_hashes, save_graph, get_graph, clear_graph, set_current_graph, get_current_graph_hash, get_current_sort, load_program, load_transformer, load_models, load_clingraph_names, save_sort, load_dependency_graph
+from ..database import load_recursive_transformations_hashes, save_graph, get_graph, clear_graph, set_current_graph, get_current_graph_hash, get_current_sort, load_program, load_transformer, load_transformer_source, load_analysis, save_analysis, load_models, load_clingraph_names, save_sort, load_dependency_graph, get_node_by_uuid, get_node_kind, get_symbol_of_node, insert_graph_relation, transaction, get_or_create_encoding_id
 
 
 bp = Blueprint("dag_api",
@@ -150,9 +149,11 @@ def get_src_tgt_mapping_from_graph(shown_recursive_ids=[],
 def find_reason_by_uuid(symbolid, nodeid):
     node = find_node_by_uuid(nodeid)
 
-    symbolstr = str(
-        getattr(next(filter(lambda x: x.uuid == symbolid, node.diff)),
-                "symbol", ""))
+    symbolstr = get_symbol_of_node(symbolid, nodeid)
+    if symbolstr is None:
+        symbolstr = str(
+            getattr(next(filter(lambda x: x.uuid == symbolid, node.diff)),
+                    "symbol", ""))
     reasonids = [
         getattr(r, "uuid", "") for r in node.reason.get(symbolstr, [])
     ]
@@ -169,13 +170,14 @@ def get_possible_transformation_orders():
             "new_index": -1,
         }
         
-        sorted_program_rules = [t.rules for t in get_current_sort()]
-        moved_item = sorted_program_rules.pop(moved_transformation["old_index"])
-        sorted_program_rules.insert(moved_transformation["new_index"], moved_item)
-        sorted_program_transformations = ProgramAnalyzer(dependency_graph=load_dependency_graph()).make_transformations_from_sorted_program(sorted_program_rules)
+        primary_hash = get_current_graph_hash()
+        sorted_program_transformations = ProgramAnalyzer(dependency_graph=load_dependency_graph()).move_transformation(
+            get_current_sort(), moved_transformation["old_index"], moved_transformation["new_index"])
         hash = hash_from_sorted_transformations(sorted_program_transformations)
-        save_sort(hash, sorted_program_transformations)
-        register_adjacent_sorts(sorted_program_transformations, hash)
+        with transaction():
+            save_sort(hash, sorted_program_transformations)
+            if hash != primary_hash:
+                insert_graph_relation(primary_hash, hash, sorted_program_transformations)
         try:
             set_current_graph(hash)
         except ValueError:
@@ -222,6 +224,10 @@ def get_rule(uuid):
 
 @bp.route("/graph/model/<uuid>", methods=["GET"])
 def get_node(uuid):
+    try:
+        return jsonify(get_node_by_uuid(uuid))
+    except KeyError:
+        pass
     graph = _get_graph()
     for node in graph.nodes():
         if node.uuid == uuid:
@@ -248,7 +254,6 @@ def entire_graph():
         sort = request.json['sort']
         sort = current_app.json.loads(sort) if type(sort) == str else sort
         save_graph(data, hash, sort)
-        register_adjacent_sorts(sort, hash)
         _ = set_current_graph(hash)
         return jsonify({'message': 'ok'}), 200
     elif request.method == "GET":
@@ -271,6 +276,10 @@ def get_atoms_in_path_by_signature(uuid: str):
 
 
 def find_node_by_uuid(uuid: str) -> Node:
+    try:
+        return get_node_by_uuid(uuid)
+    except KeyError:
+        pass
     graph = _get_graph()
     matching_nodes = [x for x, _ in graph.nodes(data=True) if x.uuid == uuid]
 
@@ -288,6 +297,10 @@ def find_node_by_uuid(uuid: str) -> Node:
 
 
 def get_kind(uuid: str) -> str:
+    try:
+        return get_node_kind(uuid)
+    except KeyError:
+        pass
     graph = _get_graph()
     node = find_node_by_uuid(uuid)
     recursive = is_recursive(node, graph)
@@ -407,9 +420,13 @@ def wrap_marked_models(
     return result
 
 
+def load_analyzer() -> ProgramAnalyzer:
+    return analyze_program(load_program(), load_transformer_source(),
+                           load_transformer, load_analysis, save_analysis)
+
+
 def generate_graph() -> nx.DiGraph:
-    analyzer = ProgramAnalyzer()
-    analyzer.add_program(load_program(), load_transformer())
+    analyzer = load_analyzer()
 
     marked_models = load_models()
     marked_models = wrap_marked_models(marked_models,
@@ -419,6 +436,7 @@ def generate_graph() -> nx.DiGraph:
         sorted_program = get_current_sort()
         reified: Collection[AST] = reify_list(
             sorted_program,
+            get_or_create_encoding_id(),
             h=analyzer.get_conflict_free_h(),
             h_showTerm=analyzer.get_conflict_free_h_showTerm(),
             model=analyzer.get_conflict_free_model(),
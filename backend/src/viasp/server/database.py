@@ -1,16 +1,25 @@
 from os.path import join, dirname, abspath
+import atexit
 import sqlite3
-from typing import Set, List, Union, Tuple, Optional, Sequence
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Set, List, Union, Tuple, Optional, Sequence, Iterator, Callable
 from uuid import UUID
-from flask import current_app, g
+from flask import current_app, g, request, has_request_context
 import networkx as nx
 import pickle
 
 from clingo.ast import Transformer
 
-from ..shared.defaults import PROGRAM_STORAGE_PATH, GRAPH_PATH
-from ..shared.event import Event, subscribe
-from ..shared.model import ClingoMethodCall, StableModel, Transformation, TransformerTransport, TransformationError
+from ..shared.defaults import PROGRAM_STORAGE_PATH, GRAPH_PATH, GRAPH_CACHE_MAX_ENTRIES, GRAPH_CACHE_MAX_BYTES, \
+    DEFAULT_ENCODING_ID, ENCODING_ID_HEADER, ENCODING_ID_COOKIE, GRAPH_STORAGE_MAX_BYTES, \
+    GRAPH_STORAGE_VACUUM_INTERVAL_SECONDS, ANALYSIS_STORAGE_MAX_ENTRIES
+from ..shared.event import Event, subscribe, unsubscribe, publish
+from ..shared.io import SymbolTable, atoms_from_symbol_ids, graph_from_node_link_data
+from ..shared.model import ClingoMethodCall, Node, StableModel, Transformation, TransformerTransport, TransformationError
 
 
 
@@ -29,9 +38,8 @@ class ProgramDatabase:
         return prg
 
     def add_to_program(self, program: str):
-        current = self.get_program()
-        current = current + program
-        self.save_program(current)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(program)
 
     def save_program(self, program: str):
         with open(self.path, "w", encoding="utf-8") as f:
@@ -47,13 +55,22 @@ class CallCenter:
     def __init__(self):
         self.calls: List[ClingoMethodCall] = []
         self.used: Set[UUID] = set()
+        self._uuids: Set[UUID] = set()
         subscribe(Event.CALL_EXECUTED, self.mark_call_as_used)
 
+    def close(self):
+        """
+        Stop listening for executed calls.
+        """
+        unsubscribe(Event.CALL_EXECUTED, self.mark_call_as_used)
+
     def append(self, call: ClingoMethodCall):
         self.calls.append(call)
+        self._uuids.add(call.uuid)
 
     def extend(self, calls: List[ClingoMethodCall]):
         self.calls.extend(calls)
+        self._uuids.update(call.uuid for call in calls)
 
     def get_all(self) -> List[ClingoMethodCall]:
         return self.calls
@@ -63,136 +80,605 @@ class CallCenter:
                            self.calls))
 
     def mark_call_as_used(self, call: ClingoMethodCall):
-        self.used.add(call.uuid)
+        if call.uuid in self._uuids:
+            self.used.add(call.uuid)
 
 def get_or_create_encoding_id() -> str:
-    # TODO
-    # if 'encoding_id' not in session:
-    #     session['encoding_id'] = uuid4().hex
-    # print(f"Returing encoding id {session['encoding_id']}", flush=True)
-    # return session['encoding_id']
-    return "0"
+    """
+    Return the encoding id of the session that sent the current request.
+    Clients identify their session with a header or a cookie, requests
+    without either share the default encoding.
+    """
+    if not has_request_context():
+        return DEFAULT_ENCODING_ID
+    if 'encoding_id' not in g:
+        g.encoding_id = request.headers.get(ENCODING_ID_HEADER) \
+            or request.cookies.get(ENCODING_ID_COOKIE) \
+            or DEFAULT_ENCODING_ID
+    return g.encoding_id
+
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS encodings (
+        id TEXT PRIMARY KEY,
+        program TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS models (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        encoding_id TEXT,
+        model TEXT,
+        FOREIGN KEY (encoding_id) REFERENCES encodings(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS graphs (
+        hash TEXT PRIMARY KEY,
+        data TEXT,
+        sort TEXT NOT NULL,
+        encoding_id TEXT,
+        FOREIGN KEY (encoding_id) REFERENCES encodings(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS current_graph (
+        hash TEXT PRIMARY KEY,
+        encoding_id TEXT,
+        FOREIGN KEY(hash) REFERENCES graphs(hash)
+        FOREIGN KEY(encoding_id) REFERENCES encodings(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS graph_relations (
+        graph_hash_1 TEXT,
+        graph_hash_2 TEXT,
+        encoding_id TEXT,
+        PRIMARY KEY (graph_hash_1, graph_hash_2),
+        FOREIGN KEY(graph_hash_1) REFERENCES graphs(hash),
+        FOREIGN KEY(graph_hash_2) REFERENCES graphs(hash)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dependency_graph (
+            encoding_id TEXT PRIMARY KEY,
+            data TEXT,
+            FOREIGN KEY(encoding_id) REFERENCES encodings(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS recursion (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        encoding_id TEXT,
+        recursive_hash TEXT,
+        FOREIGN KEY(encoding_id) REFERENCES encodings(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS clingraph (
+        filename TEXT PRIMARY KEY,
+        encoding_id TEXT,
+        FOREIGN KEY(encoding_id) REFERENCES encodings(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS transformer (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        transformer BLOB,
+        encoding_id TEXT,
+        FOREIGN KEY(encoding_id) REFERENCES encodings(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS warnings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        encoding_id TEXT,
+        warning TEXT,
+        FOREIGN KEY(encoding_id) REFERENCES encodings(id)
+    )
+    """,
+]
+
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS models_by_encoding ON models (encoding_id)",
+    "CREATE INDEX IF NOT EXISTS graphs_by_encoding ON graphs (encoding_id, hash)",
+    "CREATE INDEX IF NOT EXISTS current_graph_by_encoding ON current_graph (encoding_id)",
+    "CREATE INDEX IF NOT EXISTS graph_relations_by_graph ON graph_relations (graph_hash_1, encoding_id, graph_hash_2)",
+    "CREATE INDEX IF NOT EXISTS recursion_by_encoding ON recursion (encoding_id)",
+    "CREATE INDEX IF NOT EXISTS clingraph_by_encoding ON clingraph (encoding_id)",
+    "CREATE INDEX IF NOT EXISTS transformer_by_encoding ON transformer (encoding_id)",
+    "CREATE INDEX IF NOT EXISTS warnings_by_encoding ON warnings (encoding_id)",
+]
+
+# Each entry brings the schema from the previous version to the next one.
+# The version of a database file is kept in its user_version pragma.
+MIGRATIONS: List[List[str]] = [
+    SCHEMA,
+    INDEXES,
+    [
+        "ALTER TABLE graphs ADD COLUMN size INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE graphs ADD COLUMN accessed_at REAL",
+        "CREATE INDEX IF NOT EXISTS graphs_by_access ON graphs (accessed_at, size) WHERE data IS NOT NULL",
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS program_chunks (
+            encoding_id TEXT,
+            position INTEGER,
+            start INTEGER,
+            chunk TEXT,
+            PRIMARY KEY (encoding_id, position),
+            FOREIGN KEY(encoding_id) REFERENCES encodings(id)
+        )
+        """,
+        """
+        INSERT INTO program_chunks (encoding_id, position, start, chunk)
+        SELECT id, 0, 0, program FROM encodings WHERE program != ''
+        """,
+        "UPDATE encodings SET program = NULL",
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS nodes (
+            uuid TEXT,
+            graph_hash TEXT,
+            encoding_id TEXT,
+            rule_nr INTEGER,
+            supernode_uuid TEXT,
+            parent_uuid TEXT,
+            kind TEXT,
+            data TEXT,
+            PRIMARY KEY (graph_hash, uuid),
+            FOREIGN KEY(graph_hash) REFERENCES graphs(hash),
+            FOREIGN KEY(encoding_id) REFERENCES encodings(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS node_symbols (
+            node_uuid TEXT,
+            graph_hash TEXT,
+            symbol_id INTEGER,
+            uuid TEXT,
+            has_reason INTEGER,
+            FOREIGN KEY(graph_hash) REFERENCES graphs(hash)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS node_symbols_by_node
+        ON node_symbols (graph_hash, node_uuid, uuid)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS symbols (
+            encoding_id TEXT,
+            id INTEGER,
+            symbol TEXT,
+            PRIMARY KEY (encoding_id, id),
+            FOREIGN KEY(encoding_id) REFERENCES encodings(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS nodes_by_encoding ON nodes (encoding_id)",
+    ],
+    [
+        "CREATE INDEX IF NOT EXISTS graph_relations_by_encoding ON graph_relations (encoding_id)",
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS analyses (
+            program_hash TEXT,
+            transformer_hash TEXT,
+            data TEXT,
+            accessed_at REAL,
+            PRIMARY KEY (program_hash, transformer_hash)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS analyses_by_access ON analyses (accessed_at)",
+    ],
+]
+
+
+# The tables whose rows belong to an encoding, by their encoding_id column
+ENCODING_TABLES = ("program_chunks", "models", "graphs", "current_graph",
+                   "graph_relations", "clingraph", "transformer", "warnings",
+                   "nodes", "symbols")
+
+
+def _setup_schema(conn: sqlite3.Connection):
+    cursor = conn.cursor()
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute(f"PRAGMA user_version = {number}")
+    conn.commit()
+
+
+class _ThreadConnections:
+    """
+    Holds the connections of one thread. It is dropped with the thread-local
+    data when the thread ends, which closes the connections.
+    """
+
+    def __init__(self):
+        self.connections: Dict[str, sqlite3.Connection] = {}
+
+
+class ConnectionRegistry:
+    """
+    Keeps one long-lived sqlite connection per thread and database path.
+    The connections of a thread are closed when the thread ends, so a server
+    that starts a thread per request does not leak them.
+    The schema is created once per path, when the first connection is made.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        self._initialized: Set[str] = set()
+
+    def get_connection(self, dbpath: str) -> sqlite3.Connection:
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            holder = self._local.holder = _ThreadConnections()
+            weakref.finalize(holder, self._close, holder.connections)
+        conn = holder.connections.get(dbpath)
+        if conn is None:
+            conn = self._connect(dbpath)
+            holder.connections[dbpath] = conn
+        return conn
+
+    def open_connections(self) -> int:
+        with self._lock:
+            return len(self._connections)
+
+    def _close(self, thread_connections: Dict[str, sqlite3.Connection]):
+        with self._lock:
+            for conn in thread_connections.values():
+                if conn in self._connections:
+                    self._connections.remove(conn)
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            thread_connections.clear()
+
+    def _connect(self, dbpath: str) -> sqlite3.Connection:
+        # each connection is only used by the thread that created it,
+        # check_same_thread is disabled so close_all may run anywhere
+        conn = sqlite3.connect(dbpath, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            if dbpath not in self._initialized:
+                _setup_schema(conn)
+                self._initialized.add(dbpath)
+            self._connections.append(conn)
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+            self._initialized = set()
+        self._local = threading.local()
+
+
+connections = ConnectionRegistry()
+atexit.register(connections.close_all)
+
+
+def uuid_to_str(uuid: Union[UUID, str]) -> str:
+    return uuid.hex if isinstance(uuid, UUID) else str(uuid)
+
+
+class GraphCache:
+    """
+    Bounded LRU of decoded graphs, keyed by (graph hash, encoding id).
+    The size of an entry is estimated by the length of its stored json.
+    """
+
+    def __init__(self,
+                 max_entries: int = GRAPH_CACHE_MAX_ENTRIES,
+                 max_bytes: int = GRAPH_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, hash: str, encoding_id: str) -> Optional[nx.DiGraph]:
+        with self._lock:
+            entry = self._entries.get((hash, encoding_id))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((hash, encoding_id))
+            self.hits += 1
+            return entry[0]
+
+    def put(self, hash: str, encoding_id: str, graph: nx.DiGraph, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove((hash, encoding_id))
+            self._entries[(hash, encoding_id)] = (graph, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or \
+                    self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def invalidate(self, hash: str, encoding_id: str):
+        with self._lock:
+            self._remove((hash, encoding_id))
+
+    def invalidate_encoding(self, encoding_id: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == encoding_id]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self._bytes
+        }
+
+    def _remove(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+
+graph_cache = GraphCache()
+last_vacuum: Dict[str, float] = {}
+# estimated bytes of the fixed-size columns of a node_symbols row
+NODE_SYMBOL_ROW_BYTES = 24
+
+
+class ProgramCache:
+    """
+    Keeps the chunks of the stored programs in memory. They are only joined
+    when the program is read after a change. The lines of a program and the
+    rule texts sliced from them are kept until the program changes.
+    """
+
+    def __init__(self):
+        self._chunks: Dict[str, List[str]] = {}
+        self._programs: Dict[str, str] = {}
+        self._lines: Dict[str, List[str]] = {}
+        self._rule_texts: Dict[str, Dict[Tuple, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, encoding_id: str) -> Optional[str]:
+        with self._lock:
+            program = self._programs.get(encoding_id)
+            if program is None and encoding_id in self._chunks:
+                program = "".join(self._chunks[encoding_id])
+                self._programs[encoding_id] = program
+            return program
+
+    def get_lines(self, encoding_id: str) -> Optional[List[str]]:
+        lines = self._lines.get(encoding_id)
+        if lines is not None:
+            return lines
+        program = self.get(encoding_id)
+        if program is None:
+            return None
+        with self._lock:
+            return self._lines.setdefault(encoding_id, program.split("\n"))
+
+    def get_rule_texts(self, encoding_id: str) -> Dict[Tuple, str]:
+        """
+        Return the memo of the texts of the rules of the program, keyed by
+        their location.
+        """
+        with self._lock:
+            return self._rule_texts.setdefault(encoding_id, {})
+
+    def put(self, encoding_id: str, chunks: List[str]) -> str:
+        with self._lock:
+            self._chunks[encoding_id] = chunks
+            program = self._programs[encoding_id] = "".join(chunks)
+            self._invalidate(encoding_id)
+            return program
+
+    def append(self, encoding_id: str, chunk: str):
+        with self._lock:
+            if encoding_id in self._chunks:
+                self._chunks[encoding_id].append(chunk)
+                self._programs.pop(encoding_id, None)
+            self._invalidate(encoding_id)
+
+    def remove(self, encoding_id: str):
+        with self._lock:
+            self._chunks.pop(encoding_id, None)
+            self._programs.pop(encoding_id, None)
+            self._invalidate(encoding_id)
+
+    def _invalidate(self, encoding_id: str):
+        self._lines.pop(encoding_id, None)
+        self._rule_texts.pop(encoding_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self._programs.clear()
+            self._lines.clear()
+            self._rule_texts.clear()
+
+
+program_cache = ProgramCache()
+symbol_tables: Dict[str, SymbolTable] = {}
+
+
+def get_database_path() -> str:
+    return join(dirname(abspath(__file__)), GRAPH_PATH)
+
+
+def init_database():
+    """
+    Open the connection of the current thread and create the schema.
+    Called once on app creation, so requests do not pay for the setup.
+    """
+    connections.get_connection(get_database_path())
+
+
+def close_database():
+    connections.close_all()
+
 
 class GraphAccessor:
 
     def __init__(self):
-        self.dbpath = join(dirname(abspath(__file__)), GRAPH_PATH)
-        self.conn = sqlite3.connect(self.dbpath)
+        self.dbpath = get_database_path()
+        self.conn = connections.get_connection(self.dbpath)
         self.cursor = self.conn.cursor()
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS encodings (
-                id TEXT PRIMARY KEY,
-                program TEXT
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS models (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                encoding_id TEXT,
-                model TEXT,
-                FOREIGN KEY (encoding_id) REFERENCES encodings(id)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS graphs (
-                hash TEXT PRIMARY KEY,
-                data TEXT,
-                sort TEXT NOT NULL,
-                encoding_id TEXT,
-                FOREIGN KEY (encoding_id) REFERENCES encodings(id)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS current_graph (
-                hash TEXT PRIMARY KEY,
-                encoding_id TEXT,
-                FOREIGN KEY(hash) REFERENCES graphs(hash)
-                FOREIGN KEY(encoding_id) REFERENCES encodings(id)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS graph_relations (
-                graph_hash_1 TEXT,
-                graph_hash_2 TEXT,
-                encoding_id TEXT,
-                PRIMARY KEY (graph_hash_1, graph_hash_2),
-                FOREIGN KEY(graph_hash_1) REFERENCES graphs(hash),
-                FOREIGN KEY(graph_hash_2) REFERENCES graphs(hash)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS dependency_graph (
-                    encoding_id TEXT PRIMARY KEY,
-                    data TEXT,
-                    FOREIGN KEY(encoding_id) REFERENCES encodings(id)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS recursion (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                encoding_id TEXT,
-                recursive_hash TEXT,
-                FOREIGN KEY(encoding_id) REFERENCES encodings(id)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS clingraph (
-                filename TEXT PRIMARY KEY,
-                encoding_id TEXT,
-                FOREIGN KEY(encoding_id) REFERENCES encodings(id)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transformer (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                transformer BLOB,
-                encoding_id TEXT,
-                FOREIGN KEY(encoding_id) REFERENCES encodings(id)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS warnings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                encoding_id TEXT,
-                warning TEXT,
-                FOREIGN KEY(encoding_id) REFERENCES encodings(id)
-            )
-        """)
-        self.conn.commit()
+        self._transaction_depth = 0
+        self._rollbacks: List[Callable[[], None]] = []
+        self._after_commits: List[Callable[[], None]] = []
+        self._written_encodings: Set[str] = set()
+
+    @contextmanager
+    def transaction(self) -> Iterator["GraphAccessor"]:
+        """
+        Run all writes inside the block as one unit of work.
+        Transactions can be nested, only the outermost one commits. If the
+        block raises, everything written since it started is rolled back, and
+        the cached state of the encodings it wrote to is dropped.
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self.conn.rollback()
+                self._after_commits = []
+                rollbacks, self._rollbacks = self._rollbacks, []
+                for rollback in reversed(rollbacks):
+                    rollback()
+                for encoding_id in self._written_encodings:
+                    graph_cache.invalidate_encoding(encoding_id)
+                    program_cache.remove(encoding_id)
+                self._written_encodings = set()
+            raise
+        self._transaction_depth -= 1
+        if self._transaction_depth == 0:
+            self.conn.commit()
+            self._rollbacks = []
+            self._written_encodings = set()
+            after_commits, self._after_commits = self._after_commits, []
+            for after_commit in after_commits:
+                after_commit()
+
+    def _commit(self):
+        if self._transaction_depth == 0:
+            self.conn.commit()
+
+    def _after_commit(self, callback: Callable[[], None]):
+        """
+        Run the callback once the writes before it are committed, so caches
+        and subscribers never see uncommitted state. Dropped on rollback.
+        """
+        if self._transaction_depth > 0:
+            self._after_commits.append(callback)
+        else:
+            callback()
+
+    def _on_rollback(self, rollback: Callable[[], None]):
+        if self._transaction_depth > 0:
+            self._rollbacks.append(rollback)
+
+    def _written(self, encoding_id: str):
+        """
+        Note that the open transaction wrote to the encoding, so its cached
+        program and graphs are dropped if the transaction is rolled back.
+        """
+        if self._transaction_depth > 0:
+            self._written_encodings.add(encoding_id)
 
     # # # # # # #
     # ENCODING  #
     # # # # # # #
 
     def save_program(self, program: str, encoding_id: str):
-        self.cursor.execute(
-            """
-            INSERT OR REPLACE INTO encodings (program, id) VALUES (?, ?)
-        """, (program, encoding_id))
-        self.conn.commit()
+        with self.transaction():
+            self.clear_program(encoding_id)
+            self.add_to_program(program, encoding_id)
 
     def add_to_program(self, program: str, encoding_id: str):
-        program = self.load_program(encoding_id) + program
+        """
+        Append a chunk to the program. The stored program is never read or
+        rewritten for this, so adding n chunks costs O(n).
+        """
+        self.cursor.execute(
+            """
+            INSERT OR IGNORE INTO encodings (id) VALUES (?)
+        """, (encoding_id, ))
         self.cursor.execute(
             """
-            INSERT OR REPLACE INTO encodings (id, program) VALUES (?, ?)
-        """, (encoding_id, program))
-        self.conn.commit()
+            SELECT position, start + length(CAST(chunk AS BLOB)) FROM program_chunks
+            WHERE encoding_id = ? ORDER BY position DESC LIMIT 1
+        """, (encoding_id, ))
+        last = self.cursor.fetchone()
+        position, start = (0, 0) if last is None else (last[0] + 1, last[1])
+        self.cursor.execute(
+            """
+            INSERT INTO program_chunks (encoding_id, position, start, chunk) VALUES (?, ?, ?, ?)
+        """, (encoding_id, position, start, program))
+        self._written(encoding_id)
+        self._commit()
+        self._after_commit(lambda: program_cache.append(encoding_id, program))
+        self._after_commit(
+            lambda: publish(Event.PROGRAM_CHANGED, encoding_id=encoding_id))
 
     def load_program(self, encoding_id: str) -> str:
+        """
+        Return the program of the encoding. Inside a transaction that wrote
+        to it, the program is read from the database and not cached.
+        """
+        uncommitted = encoding_id in self._written_encodings
+        program = None if uncommitted else program_cache.get(encoding_id)
+        if program is not None:
+            return program
         self.cursor.execute(
             """
-            SELECT program FROM encodings WHERE id = (?)
+            SELECT chunk FROM program_chunks WHERE encoding_id = (?) ORDER BY position
         """, (encoding_id, ))
-        result = self.cursor.fetchone()
-        return result[0] if result is not None else ""
+        chunks = [r[0] for r in self.cursor.fetchall()]
+        if uncommitted:
+            return "".join(chunks)
+        return program_cache.put(encoding_id, chunks)
 
     def clear_program(self, encoding_id: str):
+        self.cursor.execute(
+            """
+            DELETE FROM program_chunks WHERE encoding_id = (?)
+        """, (encoding_id, ))
         self.cursor.execute(
             """
             DELETE FROM encodings WHERE id = (?)
         """, (encoding_id, ))
-        self.conn.commit()
+        self._written(encoding_id)
+        self._commit()
+        self._after_commit(lambda: program_cache.put(encoding_id, []))
+        self._after_commit(
+            lambda: publish(Event.PROGRAM_CHANGED, encoding_id=encoding_id))
 
     # # # # # # #
     #  MODELS   #
@@ -200,14 +686,13 @@ class GraphAccessor:
 
     def set_models(self, parsed_models: Sequence[Union[StableModel, str]],
                    encoding_id: str):
-        self.clear_models(encoding_id)
-        for model in parsed_models:
-            json_model = current_app.json.dumps(model)
-            self.cursor.execute(
+        with self.transaction():
+            self.clear_models(encoding_id)
+            self.cursor.executemany(
                 """
                 INSERT INTO models (encoding_id, model) VALUES (?, ?)
-            """, (encoding_id, json_model))
-        self.conn.commit()
+            """, [(encoding_id, current_app.json.dumps(model))
+                  for model in parsed_models])
 
     def load_models(self, encoding_id: str) -> List[StableModel]:
         self.cursor.execute(
@@ -223,7 +708,7 @@ class GraphAccessor:
             """
             DELETE FROM models WHERE encoding_id = (?)
         """, (encoding_id, ))
-        self.conn.commit()
+        self._commit()
 
     # # # # # # # #
     #    GRAPHS   #
@@ -231,12 +716,211 @@ class GraphAccessor:
 
     def save_graph(self, graph: nx.Graph, hash: str,
                    sort: List[Transformation], encoding_id: str):
+        symbol_table = self.get_symbol_table(encoding_id)
+        data = current_app.json.dumps(nx.node_link_data(graph),
+                                      symbol_table=symbol_table)
         self.cursor.execute(
             """
-            INSERT OR REPLACE INTO graphs (data, hash, sort, encoding_id) VALUES (?, ?, ?, ?)
-        """, (current_app.json.dumps(nx.node_link_data(graph)), hash,
-              current_app.json.dumps(sort), encoding_id))
-        self.conn.commit()
+            INSERT OR REPLACE INTO graphs (data, hash, sort, encoding_id, size, accessed_at) VALUES (?, ?, ?, ?, ?, ?)
+        """, (data, hash, current_app.json.dumps(sort), encoding_id,
+              len(data), time.time()))
+        self._delete_nodes([hash])
+        node_size = self._save_nodes(graph, hash, encoding_id, symbol_table)
+        self.cursor.execute("UPDATE graphs SET size = size + ? WHERE hash = ?",
+                            (node_size, hash))
+        self._save_symbols(symbol_table, encoding_id)
+        self._written(encoding_id)
+        self._commit()
+        graph_cache.invalidate(hash, encoding_id)
+        self.collect_garbage()
+
+    def collect_garbage(self, max_bytes: int = GRAPH_STORAGE_MAX_BYTES):
+        """
+        Keep the stored graphs below max_bytes and compact the database file
+        from time to time. Evicted graphs are generated again when visited.
+        """
+        if self.evict_graphs(max_bytes) > 0:
+            self.vacuum()
+
+    def evict_graphs(self, max_bytes: int) -> int:
+        """
+        Drop the data and the nodes of the least recently visited graphs until
+        the stored graphs take up at most max_bytes. The size of a graph
+        counts its data and its rows in nodes and node_symbols. The current
+        graph of every encoding and the sorts themselves are kept. Returns the
+        number of evicted graphs.
+        """
+        self.cursor.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM graphs WHERE data IS NOT NULL")
+        total = self.cursor.fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        self.cursor.execute(
+            """
+            SELECT hash, encoding_id, size FROM graphs
+            WHERE data IS NOT NULL AND hash NOT IN (SELECT hash FROM current_graph)
+            ORDER BY accessed_at
+        """)
+        evicted = []
+        for hash, encoding_id, size in self.cursor.fetchall():
+            if total <= max_bytes:
+                break
+            evicted.append((hash, encoding_id))
+            total -= size
+        self.cursor.executemany(
+            "UPDATE graphs SET data = NULL, size = 0 WHERE hash = ?",
+            [(hash, ) for hash, _ in evicted])
+        self._delete_nodes([hash for hash, _ in evicted])
+        self._commit()
+        for hash, encoding_id in evicted:
+            graph_cache.invalidate(hash, encoding_id)
+        return len(evicted)
+
+    def vacuum(self, interval: float = GRAPH_STORAGE_VACUUM_INTERVAL_SECONDS):
+        """
+        Give the space of deleted rows back to the file system, at most once
+        per interval. Skipped while a transaction is open.
+        """
+        now = time.time()
+        if self._transaction_depth > 0 or self.conn.in_transaction \
+                or now - last_vacuum.get(self.dbpath, 0.0) < interval:
+            return
+        last_vacuum[self.dbpath] = now
+        self.conn.execute("VACUUM")
+
+    def _save_nodes(self, graph: nx.DiGraph, hash: str, encoding_id: str,
+                    symbol_table: SymbolTable) -> int:
+        """
+        Store the nodes of the graph one per row, with the symbols of their
+        diffs. Returns the estimated number of bytes of the stored rows.
+        """
+        node_rows = []
+        symbol_rows = []
+
+        def add(node: Node, kind: str, supernode_uuid: Optional[str]):
+            uuid = uuid_to_str(node.uuid)
+            parent_uuid = None if node.parent is None else uuid_to_str(
+                node.parent.uuid)
+            node_rows.append((uuid, hash, encoding_id, node.rule_nr,
+                              supernode_uuid, parent_uuid, kind,
+                              current_app.json.dumps(
+                                  node, symbol_table=symbol_table)))
+            for s in node.diff:
+                symbol_rows.append((uuid, hash, symbol_table.intern(s.symbol),
+                                    uuid_to_str(s.uuid), s.has_reason))
+
+        for node in graph.nodes:
+            if not isinstance(node, Node):
+                continue
+            if graph.out_degree(node) == 0:
+                kind = "Answer Set"
+            elif graph.in_degree(node) == 0:
+                kind = "Facts"
+            else:
+                kind = "Answer Set"
+            add(node, kind, None)
+            for subnode in node.recursive:
+                add(subnode, "Model", uuid_to_str(node.uuid))
+        self.cursor.executemany(
+            """
+            INSERT OR REPLACE INTO nodes (uuid, graph_hash, encoding_id, rule_nr, supernode_uuid, parent_uuid, kind, data)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, node_rows)
+        self.cursor.executemany(
+            """
+            INSERT INTO node_symbols (node_uuid, graph_hash, symbol_id, uuid, has_reason)
+            VALUES (?, ?, ?, ?, ?)
+        """, symbol_rows)
+        return sum(len(row[0]) + len(row[7]) for row in node_rows) \
+            + sum(len(row[0]) + len(row[3]) + NODE_SYMBOL_ROW_BYTES for row in symbol_rows)
+
+    def _delete_nodes(self, hashes: Sequence[str]):
+        self.cursor.executemany("DELETE FROM nodes WHERE graph_hash = ?",
+                                [(h, ) for h in hashes])
+        self.cursor.executemany(
+            "DELETE FROM node_symbols WHERE graph_hash = ?",
+            [(h, ) for h in hashes])
+
+    def load_node(self, uuid: str, hash: str, encoding_id: str) -> Node:
+        self.cursor.execute(
+            """
+            SELECT data FROM nodes WHERE graph_hash = ? AND uuid = ? AND encoding_id = ?
+        """, (hash, uuid, encoding_id))
+        result = self.cursor.fetchone()
+        if result is None:
+            raise KeyError("The node is not in the database")
+        symbol_table = self.get_symbol_table(encoding_id)
+        node = current_app.json.loads(result[0], symbol_table=symbol_table)
+        if not node.has_atoms():
+            inherited = self._load_inherited_symbols(uuid, hash)
+            node.atoms = frozenset(node.diff).union(
+                atoms_from_symbol_ids(inherited, (), node.uuid,
+                                      symbol_table))
+        return node
+
+    def _load_inherited_symbols(self, uuid: str, hash: str) -> List[int]:
+        """
+        Return the ids of the symbols in the diffs of all ancestors of a node.
+        """
+        self.cursor.execute(
+            """
+            WITH RECURSIVE ancestors(uuid) AS (
+                SELECT parent_uuid FROM nodes WHERE graph_hash = ? AND uuid = ?
+                UNION
+                SELECT nodes.parent_uuid FROM nodes
+                JOIN ancestors ON nodes.uuid = ancestors.uuid
+                WHERE nodes.graph_hash = ?
+            )
+            SELECT DISTINCT symbol_id FROM node_symbols
+            JOIN ancestors ON node_symbols.node_uuid = ancestors.uuid
+            WHERE node_symbols.graph_hash = ?
+        """, (hash, uuid, hash, hash))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def load_node_kind(self, uuid: str, hash: str, encoding_id: str) -> str:
+        self.cursor.execute(
+            """
+            SELECT kind FROM nodes WHERE graph_hash = ? AND uuid = ? AND encoding_id = ?
+        """, (hash, uuid, encoding_id))
+        result = self.cursor.fetchone()
+        if result is None:
+            raise KeyError("The node is not in the database")
+        return result[0]
+
+    def load_symbol_of_node(self, symbol_uuid: str, node_uuid: str,
+                            hash: str, encoding_id: str) -> Optional[str]:
+        self.cursor.execute(
+            """
+            SELECT symbol_id FROM node_symbols
+            WHERE graph_hash = ? AND node_uuid = ? AND uuid = ?
+        """, (hash, node_uuid, symbol_uuid))
+        result = self.cursor.fetchone()
+        if result is None:
+            return None
+        return str(self.get_symbol_table(encoding_id).lookup(result[0]))
+
+    # # # # # # # #
+    #   SYMBOLS   #
+    # # # # # # # #
+
+    def get_symbol_table(self, encoding_id: str) -> SymbolTable:
+        table = symbol_tables.get(encoding_id)
+        if table is None:
+            self.cursor.execute(
+                """
+                SELECT id, symbol FROM symbols WHERE encoding_id = (?)
+            """, (encoding_id, ))
+            table = symbol_tables.setdefault(
+                encoding_id, SymbolTable(self.cursor.fetchall()))
+        return table
+
+    def _save_symbols(self, symbol_table: SymbolTable, encoding_id: str):
+        pending = symbol_table.take_pending()
+        self._on_rollback(lambda: symbol_table.restore_pending(pending))
+        self.cursor.executemany(
+            """
+            INSERT OR IGNORE INTO symbols (encoding_id, id, symbol) VALUES (?, ?, ?)
+        """, [(encoding_id, id, symbol) for id, symbol in pending])
 
     def set_current_graph(self, hash: str, encoding_id: str):
         self.cursor.execute(
@@ -246,7 +930,10 @@ class GraphAccessor:
         self.cursor.execute(
             "INSERT INTO current_graph (hash, encoding_id) VALUES (?, ?)",
             (hash, encoding_id))
-        self.conn.commit()
+        self.cursor.execute("UPDATE graphs SET accessed_at = ? WHERE hash = ?",
+                            (time.time(), hash))
+        self._written(encoding_id)
+        self._commit()
 
     def get_current_graph_hash(self, encoding_id: str) -> str:
         self.cursor.execute(
@@ -271,16 +958,24 @@ class GraphAccessor:
         raise ValueError("No graph found")
 
     def load_graph(self, hash: str, encoding_id: str) -> nx.DiGraph:
+        graph = graph_cache.get(hash, encoding_id)
+        if graph is not None:
+            return graph
         graph_json_str = self.load_graph_json(hash, encoding_id)
-        return nx.node_link_graph(current_app.json.loads(graph_json_str))
+        graph = graph_from_node_link_data(
+            current_app.json.loads(
+                graph_json_str,
+                symbol_table=self.get_symbol_table(encoding_id)))
+        graph_cache.put(hash, encoding_id, graph, len(graph_json_str))
+        return graph
 
     def load_current_graph_json(self, encoding_id: str) -> str:
         hash = self.get_current_graph_hash(encoding_id)
         return self.load_graph_json(hash, encoding_id)
 
     def load_current_graph(self, encoding_id: str) -> nx.DiGraph:
-        graph_json_str = self.load_current_graph_json(encoding_id)
-        return nx.node_link_graph(current_app.json.loads(graph_json_str))
+        hash = self.get_current_graph_hash(encoding_id)
+        return self.load_graph(hash, encoding_id)
 
     # # # # # # # #
     #   SORTS     #
@@ -293,7 +988,12 @@ class GraphAccessor:
             INSERT OR REPLACE INTO graphs (hash, data, sort, encoding_id) VALUES (?, ?, ?, ?)
         """, [(hash, None, current_app.json.dumps(sort), encoding_id)
               for hash, sort, encoding_id in sorts])
-        self.conn.commit()
+        self._delete_nodes([hash for hash, _, _ in sorts])
+        for _, _, encoding_id in sorts:
+            self._written(encoding_id)
+        self._commit()
+        for hash, _, encoding_id in sorts:
+            graph_cache.invalidate(hash, encoding_id)
 
     def save_sort(self, hash: str, sort: List[Transformation],
                   encoding_id: str):
@@ -301,7 +1001,10 @@ class GraphAccessor:
             """
             INSERT OR REPLACE INTO graphs (hash, data, sort, encoding_id) VALUES (?, ?, ?, ?)
         """, (hash, None, current_app.json.dumps(sort), encoding_id))
-        self.conn.commit()
+        self._delete_nodes([hash])
+        self._written(encoding_id)
+        self._commit()
+        graph_cache.invalidate(hash, encoding_id)
 
     def get_current_sort(self, encoding_id: str) -> List[Transformation]:
         hash = self.get_current_graph_hash(encoding_id)
@@ -337,31 +1040,34 @@ class GraphAccessor:
 
     def insert_graph_adjacency(self, hash1: str, hash2: str,
                               sort2: List[Transformation], encoding_id: str):
-        self.cursor.execute("SELECT hash FROM graphs WHERE hash = ?",
-                            (hash2, ))
-        result = self.cursor.fetchone()
-
-        if result is None:
-            self.save_sort(hash2, sort2, encoding_id)
-        self.insert_graph_adjacency_element(hash1, hash2, encoding_id)
-        self.insert_graph_adjacency_element(hash2, hash1, encoding_id)
-        self.conn.commit()
-
-    def insert_graph_adjacency_element(self, hash1: str, hash2: str, encoding_id: str):
-        try:
-            self.cursor.execute(
-                """
-                INSERT INTO graph_relations (graph_hash_1, graph_hash_2, encoding_id) VALUES (?, ?, ?)
-            """, (hash1, hash2, encoding_id))
-        except sqlite3.IntegrityError:
-            pass
+        self.insert_graph_adjacencies(hash1, [(hash2, sort2)], encoding_id)
+
+    def insert_graph_adjacencies(self, hash1: str,
+                                 adjacent: Sequence[Tuple[str, List[Transformation]]],
+                                 encoding_id: str):
+        """
+        Relate the graph to all adjacent sorts at once. Sorts that are not
+        in the database yet are saved without a graph.
+        """
+        self.cursor.executemany(
+            """
+            INSERT OR IGNORE INTO graphs (hash, data, sort, encoding_id) VALUES (?, ?, ?, ?)
+        """, [(hash2, None, current_app.json.dumps(sort2), encoding_id)
+              for hash2, sort2 in adjacent])
+        self.cursor.executemany(
+            """
+            INSERT OR IGNORE INTO graph_relations (graph_hash_1, graph_hash_2, encoding_id) VALUES (?, ?, ?)
+        """, [relation for hash2, _ in adjacent
+              for relation in ((hash1, hash2, encoding_id),
+                               (hash2, hash1, encoding_id))])
+        self._commit()
 
     def save_dependency_graph(self, data: nx.DiGraph, encoding_id: str):
         self.cursor.execute(
             """
             INSERT OR REPLACE INTO dependency_graph (data, encoding_id) VALUES (?, ?)
         """, (current_app.json.dumps(nx.node_link_data(data)), encoding_id))
-        self.conn.commit()
+        self._commit()
 
     def load_dependency_graph(self, encoding_id: str) -> nx.DiGraph:
         self.cursor.execute(
@@ -383,11 +1089,21 @@ class GraphAccessor:
         return [r[0] for r in result]
 
     def clear_all_sorts(self, encoding_id: str):
+        self.cursor.execute(
+            """
+            DELETE FROM node_symbols WHERE graph_hash IN (SELECT hash FROM graphs WHERE encoding_id = ?)
+        """, (encoding_id, ))
+        self.cursor.execute(
+            """
+            DELETE FROM nodes WHERE encoding_id = (?)
+        """, (encoding_id, ))
         self.cursor.execute(
             """
             DELETE FROM graphs WHERE encoding_id = (?)
         """, (encoding_id, ))
-        self.conn.commit()
+        self._written(encoding_id)
+        self._commit()
+        graph_cache.invalidate_encoding(encoding_id)
 
     # # # # # # # #
     #  RECURSION  #
@@ -395,12 +1111,11 @@ class GraphAccessor:
 
     def save_recursive_transformations_hashes(self, transformations: Set[str],
                                               encoding_id: str):
-        for t in transformations:
-            self.cursor.execute(
-                """
-                INSERT INTO recursion (encoding_id, recursive_hash) VALUES (?, ?)
-            """, (encoding_id, t))
-        self.conn.commit()
+        self.cursor.executemany(
+            """
+            INSERT INTO recursion (encoding_id, recursive_hash) VALUES (?, ?)
+        """, [(encoding_id, t) for t in transformations])
+        self._commit()
 
     def load_recursive_transformations_hashes(self,
                                               encoding_id: str) -> Set[str]:
@@ -416,7 +1131,7 @@ class GraphAccessor:
             """
             DELETE FROM recursion WHERE encoding_id = (?)
         """, (encoding_id, ))
-        self.conn.commit()
+        self._commit()
 
     # # # # # # # #
     #  CLINGRAPH  #
@@ -427,14 +1142,14 @@ class GraphAccessor:
             """
             INSERT OR REPLACE INTO clingraph (filename, encoding_id) VALUES (?, ?)
         """, (filename, encoding_id))
-        self.conn.commit()
+        self._commit()
 
     def clear_clingraph(self, encoding_id: str):
         self.cursor.execute(
             """
             DELETE FROM clingraph WHERE encoding_id = (?)
         """, (encoding_id, ))
-        self.conn.commit()
+        self._commit()
 
     def load_all_clingraphs(self, encoding_id: str) -> List[str]:
         self.cursor.execute(
@@ -454,16 +1169,16 @@ class GraphAccessor:
             """
             DELETE FROM warnings WHERE encoding_id = (?)
         """, (encoding_id, ))
-        self.conn.commit()
+        self._commit()
 
     def save_warnings(self, warnings: List[TransformationError],
                       encoding_id: str):
-        for warning in warnings:
-            self.cursor.execute(
-                """
-                INSERT INTO warnings (encoding_id, warning) VALUES (?, ?)
-            """, (encoding_id, current_app.json.dumps(warning)))
-        self.conn.commit()
+        self.cursor.executemany(
+            """
+            INSERT INTO warnings (encoding_id, warning) VALUES (?, ?)
+        """, [(encoding_id, current_app.json.dumps(warning))
+              for warning in warnings])
+        self._commit()
 
     def load_warnings(self, encoding_id: str) -> List[str]:
         self.cursor.execute(
@@ -473,6 +1188,46 @@ class GraphAccessor:
         result = self.cursor.fetchall()
         return [current_app.json.loads(r[0]) for r in result]
 
+    # # # # # # # # # #
+    #    ANALYSES     #
+    # # # # # # # # # #
+
+    def save_analysis(self, program_hash: str, transformer_hash: str,
+                      analysis: Dict,
+                      max_entries: int = ANALYSIS_STORAGE_MAX_ENTRIES):
+        """
+        Store the analysis of a program under the hashes of the program and
+        the transformer. They do not belong to an encoding, so encodings with
+        the same program share it. Only the max_entries most recently used
+        analyses are kept.
+        """
+        self.cursor.execute(
+            """
+            INSERT OR REPLACE INTO analyses (program_hash, transformer_hash, data, accessed_at) VALUES (?, ?, ?, ?)
+        """, (program_hash, transformer_hash, current_app.json.dumps(analysis),
+              time.time()))
+        self.cursor.execute(
+            """
+            DELETE FROM analyses WHERE rowid NOT IN
+            (SELECT rowid FROM analyses ORDER BY accessed_at DESC LIMIT ?)
+        """, (max_entries, ))
+        self._commit()
+
+    def load_analysis(self, program_hash: str,
+                      transformer_hash: str) -> Optional[Dict]:
+        self.cursor.execute(
+            """
+            SELECT data FROM analyses WHERE program_hash = ? AND transformer_hash = ?
+        """, (program_hash, transformer_hash))
+        result = self.cursor.fetchone()
+        if result is None:
+            return None
+        self.cursor.execute(
+            "UPDATE analyses SET accessed_at = ? WHERE program_hash = ? AND transformer_hash = ?",
+            (time.time(), program_hash, transformer_hash))
+        self._commit()
+        return current_app.json.loads(result[0])
+
     # # # # # # # # # # # # # # #
     #   REGISTERED TRANFORMER   #
     # # # # # # # # # # # # # # #
@@ -483,7 +1238,9 @@ class GraphAccessor:
             """
             INSERT OR REPLACE INTO transformer (transformer, encoding_id) VALUES (?, ?)
         """, (current_app.json.dumps(transformer), encoding_id))
-        self.conn.commit()
+        self._commit()
+        self._after_commit(
+            lambda: publish(Event.TRANSFORMER_CHANGED, encoding_id=encoding_id))
 
     def load_transformer(self, encoding_id: str) -> Optional[Transformer]:
         self.cursor.execute(
@@ -494,20 +1251,55 @@ class GraphAccessor:
         return current_app.json.loads(
             result[0]) if result is not None else None
 
+    def load_transformer_source(self, encoding_id: str) -> str:
+        """
+        Return the stored transformer without loading it, or an empty string
+        if no transformer is registered.
+        """
+        self.cursor.execute(
+            """
+            SELECT transformer FROM transformer WHERE encoding_id = (?)
+        """, (encoding_id, ))
+        result = self.cursor.fetchone()
+        return result[0] if result is not None else ""
+
     # # # # # # # #
     #   GENERAL   #
     # # # # # # # #
 
-    def clear(self):
-        self.cursor.execute("DELETE FROM encodings")
-        self.cursor.execute("DELETE FROM models")
-        self.cursor.execute("DELETE FROM graphs")
-        self.cursor.execute("DELETE FROM current_graph")
-        self.cursor.execute("DELETE FROM graph_relations")
-        self.cursor.execute("DELETE FROM clingraph")
-        self.cursor.execute("DELETE FROM transformer")
-        self.cursor.execute("DELETE FROM warnings")
-        self.conn.commit()
+    def clear(self, encoding_id: str):
+        """
+        Delete everything stored for the encoding. Other encodings are not
+        touched.
+        """
+        self.cursor.execute(
+            """
+            DELETE FROM node_symbols WHERE graph_hash IN (SELECT hash FROM graphs WHERE encoding_id = ?)
+        """, (encoding_id, ))
+        for table in ENCODING_TABLES:
+            self.cursor.execute(
+                f"DELETE FROM {table} WHERE encoding_id = ?", (encoding_id, ))
+        self.cursor.execute("DELETE FROM encodings WHERE id = ?",
+                            (encoding_id, ))
+        self._written(encoding_id)
+        self._commit()
+        graph_cache.invalidate_encoding(encoding_id)
+        program_cache.remove(encoding_id)
+        symbol_tables.pop(encoding_id, None)
+        self._after_commit(
+            lambda: publish(Event.PROGRAM_CHANGED, encoding_id=encoding_id))
+
+    def clear_all(self):
+        """
+        Delete the stored data of all encodings and the stored analyses.
+        """
+        self.cursor.execute(" UNION ".join(
+            ["SELECT id FROM encodings"] +
+            [f"SELECT encoding_id FROM {table}" for table in ENCODING_TABLES]))
+        for encoding_id, in self.cursor.fetchall():
+            self.clear(encoding_id)
+        self.cursor.execute("DELETE FROM analyses")
+        self._commit()
 
 
 def get_database():
@@ -516,6 +1308,10 @@ def get_database():
     return g.graph_accessor
 
 
+def transaction():
+    return get_database().transaction()
+
+
 def load_program() -> str:
     encoding_id = get_or_create_encoding_id()
     return get_database().load_program(encoding_id)
@@ -564,6 +1360,10 @@ def insert_graph_relation(hash1: str, hash2: str, sort2: List[Transformation]):
     encoding_id = get_or_create_encoding_id()
     get_database().insert_graph_adjacency(hash1, hash2, sort2, encoding_id)
 
+def insert_graph_relations(hash1: str, adjacent: Sequence[Tuple[str, List[Transformation]]]):
+    encoding_id = get_or_create_encoding_id()
+    get_database().insert_graph_adjacencies(hash1, adjacent, encoding_id)
+
 def get_adjacent_graphs_hashes(hash: str) -> List[str]:
     encoding_id = get_or_create_encoding_id()
     return get_database().get_adjacent_graphs_hashes(hash, encoding_id)
@@ -592,6 +1392,28 @@ def get_graph() -> nx.DiGraph:
     return graph
 
 
+def get_node_by_uuid(uuid: str) -> Node:
+    encoding_id = get_or_create_encoding_id()
+    db = get_database()
+    return db.load_node(uuid, db.get_current_graph_hash(encoding_id),
+                        encoding_id)
+
+
+def get_node_kind(uuid: str) -> str:
+    encoding_id = get_or_create_encoding_id()
+    db = get_database()
+    return db.load_node_kind(uuid, db.get_current_graph_hash(encoding_id),
+                             encoding_id)
+
+
+def get_symbol_of_node(symbol_uuid: str, node_uuid: str) -> Optional[str]:
+    encoding_id = get_or_create_encoding_id()
+    db = get_database()
+    return db.load_symbol_of_node(symbol_uuid, node_uuid,
+                                  db.get_current_graph_hash(encoding_id),
+                                  encoding_id)
+
+
 def get_graph_json() -> str:
     encoding_id = get_or_create_encoding_id()
     return get_database().load_current_graph_json(encoding_id)
@@ -638,8 +1460,21 @@ def load_transformer() -> Optional[Transformer]:
     encoding_id = get_or_create_encoding_id()
     return get_database().load_transformer(encoding_id)
 
+def load_transformer_source() -> str:
+    encoding_id = get_or_create_encoding_id()
+    return get_database().load_transformer_source(encoding_id)
+
 def clear_graph():
-    get_database().clear()
+    encoding_id = get_or_create_encoding_id()
+    get_database().clear(encoding_id)
+
+
+def save_analysis(program_hash: str, transformer_hash: str, analysis: Dict):
+    get_database().save_analysis(program_hash, transformer_hash, analysis)
+
+
+def load_analysis(program_hash: str, transformer_hash: str) -> Optional[Dict]:
+    return get_database().load_analysis(program_hash, transformer_hash)
 
 
 def save_transformer(transformer: TransformerTransport):
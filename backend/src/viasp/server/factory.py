@@ -3,6 +3,7 @@ from werkzeug.utils import find_modules, import_string
 
 from flask_cors import CORS
 from viasp.shared.io import DataclassJSONProvider
+from viasp.server.database import init_database
 
 
 def register_blueprints(app):
@@ -20,6 +21,7 @@ def create_app():
     app.config['CORS_HEADERS'] = 'Content-Type'
 
     register_blueprints(app)
+    init_database()
     CORS(app, resources={r"/*": {"origins": "*"}}, max_age=3600)
 
     return app
@@ -112,7 +112,8 @@ def run(host=DEFAULT_BACKEND_HOST, port=DEFAULT_BACKEND_PORT):
         """
         if os.path.exists(CLINGRAPH_PATH):
             shutil.rmtree(CLINGRAPH_PATH)
-        for file in [GRAPH_PATH, PROGRAM_STORAGE_PATH, STDIN_TMP_STORAGE_PATH]:
+        for file in [GRAPH_PATH, f"{GRAPH_PATH}-wal", f"{GRAPH_PATH}-shm",
+                     PROGRAM_STORAGE_PATH, STDIN_TMP_STORAGE_PATH]:
             if os.path.exists(file):
                 os.remove(file)
 
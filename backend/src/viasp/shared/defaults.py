@@ -15,4 +15,25 @@ PROGRAM_STORAGE_PATH = SHARED_PATH / "prg.lp"
 STDIN_TMP_STORAGE_PATH = SHARED_PATH / "viasp_stdin_tmp.lp"
 COLOR_PALETTE_PATH = SERVER_PATH / "colorPalette.json"
 SORTGENERATION_TIMEOUT_SECONDS = 10
-SORTGENERATION_BATCH_SIZE = 1000
\ No newline at end of file
+SORTGENERATION_BATCH_SIZE = 1000
+GRAPH_CACHE_MAX_ENTRIES = 32
+GRAPH_CACHE_MAX_BYTES = 256 * 1024 * 1024
+GRAPH_STORAGE_MAX_BYTES = 512 * 1024 * 1024
+GRAPH_STORAGE_VACUUM_INTERVAL_SECONDS = 600
+DEFAULT_ENCODING_ID = "0"
+ENCODING_ID_HEADER = "X-Viasp-Encoding-Id"
+ENCODING_ID_COOKIE = "viasp_encoding_id"
+SESSION_TIMEOUT_SECONDS = 24 * 60 * 60
+JUSTIFICATION_WORKERS = min(4, os.cpu_count() or 1)
+JUSTIFICATION_PARALLEL_MIN_MODELS = 8
+JUSTIFICATION_BATCHED = True
+JUSTIFICATION_BATCH_SIZE = 16
+DERIVATION_CACHE_MAX_ENTRIES = 65536
+FACT_BASE_CACHE_MAX_ENTRIES = 8
+REIFICATION_CACHE_MAX_ENTRIES = 4096
+ANALYSIS_CACHE_MAX_ENTRIES = 8
+ANALYSIS_STORAGE_MAX_ENTRIES = 256
+RECURSION_CACHE_MAX_ENTRIES = 4096
+RECURSION_MAX_STEPS = 100000
+RECURSION_TIMEOUT_SECONDS = 60
+HASH_DIGEST_SIZE = 20
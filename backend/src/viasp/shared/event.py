@@ -5,6 +5,8 @@ REGISTRY = {}
 
 class Event(Enum):
     CALL_EXECUTED = 1
+    PROGRAM_CHANGED = 2
+    TRANSFORMER_CHANGED = 3
 
 
 def on(event: Event):
@@ -19,6 +21,12 @@ def subscribe(event, listener):
     REGISTRY.setdefault(event, []).append(listener)
 
 
+def unsubscribe(event, listener):
+    listeners = REGISTRY.get(event, [])
+    if listener in listeners:
+        listeners.remove(listener)
+
+
 def publish(event, *args, **kwargs):
     for listener in REGISTRY.get(event, []):
         listener(*args, **kwargs)
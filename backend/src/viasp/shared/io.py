@@ -5,11 +5,13 @@ from json import JSONDecoder, JSONEncoder
 # from enum import IntEnum
 from flask.json.provider import JSONProvider
 from dataclasses import is_dataclass
-from typing import Union, Collection, Iterable, Sequence, cast, Tuple
+from typing import Union, Collection, Iterable, Sequence, cast, Tuple, Dict, List, Optional
+from functools import partial
 from pathlib import PosixPath
-from uuid import UUID
+from uuid import UUID, uuid5, NAMESPACE_URL
 import os
 import sys
+import threading
 import importlib.util
 
 
@@ -27,6 +29,57 @@ from clingo.ast import AST, ASTType
 
 from .interfaces import ViaspClient
 from .model import Node, ClingraphNode, Transformation, Signature, StableModel, ClingoMethodCall, TransformationError, FailedReason, SymbolIdentifier, TransformerTransport, RuleContainer
+from .util import pairwise
+
+class SymbolTable:
+    """
+    Assigns an integer id to every distinct symbol of an encoding.
+    Stored graphs refer to symbols by their id instead of nesting them.
+    """
+
+    def __init__(self, symbols: Iterable[Tuple[int, str]] = ()):
+        self._ids: Dict[Symbol, int] = {}
+        self._symbols: Dict[int, Symbol] = {}
+        self._pending: List[Tuple[int, str]] = []
+        self._lock = threading.Lock()
+        self._next_id = 0
+        for id, symbol_str in symbols:
+            symbol = clingo.parse_term(symbol_str)
+            self._ids[symbol] = id
+            self._symbols[id] = symbol
+            self._next_id = max(self._next_id, id + 1)
+
+    def intern(self, symbol: Symbol) -> int:
+        id = self._ids.get(symbol)
+        if id is not None:
+            return id
+        with self._lock:
+            id = self._ids.get(symbol)
+            if id is None:
+                id = self._next_id
+                self._next_id += 1
+                self._ids[symbol] = id
+                self._symbols[id] = symbol
+                self._pending.append((id, str(symbol)))
+        return id
+
+    def lookup(self, id: int) -> Symbol:
+        return self._symbols[id]
+
+    def take_pending(self) -> List[Tuple[int, str]]:
+        """Return the symbols that were added since the last call."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    def restore_pending(self, pending: List[Tuple[int, str]]):
+        """Queue symbols again whose saving was rolled back."""
+        with self._lock:
+            self._pending = pending + self._pending
+
+    def __len__(self):
+        return len(self._symbols)
+
 
 class DataclassJSONProvider(JSONProvider):
     def dumps(self, obj, **kwargs):
@@ -39,12 +92,14 @@ def model_to_json(model: Union[clingo_Model, Collection[clingo_Model]], *args, *
     return json.dumps(model, *args, cls=DataclassJSONEncoder, **kwargs)
 
 
-def object_hook(obj):
+def object_hook(obj, symbol_table: Optional[SymbolTable] = None):
     if '_type' not in obj:
         return obj
     t = obj['_type']
     del obj['_type']
-    if t == "Function":
+    if t == "SymbolRef" and symbol_table is not None:
+        return symbol_table.lookup(obj["id"])
+    elif t == "Function":
         return clingo.Function(**obj)
     elif t == "Number":
         return clingo.Number(**obj)
@@ -55,9 +110,18 @@ def object_hook(obj):
     elif t == "Supremum":
         return clingo.Supremum
     elif t == "Node":
-        obj['atoms'] = frozenset(obj['atoms'])
+        if 'atoms' in obj:
+            if symbol_table is not None:
+                obj['atoms'] = atoms_from_symbol_ids(obj['atoms'], obj['diff'],
+                                                     obj.get('uuid', ""),
+                                                     symbol_table)
+            obj['atoms'] = frozenset(obj['atoms'])
         obj['diff'] = frozenset(obj['diff'])
-        return Node(**obj)
+        node = Node(**obj)
+        for u, v in pairwise(node.recursive):
+            if not v.has_atoms():
+                v.parent = u
+        return node
     elif t == "ClingraphNode":
         return ClingraphNode(**obj)
     elif t == "Transformation":
@@ -75,36 +139,108 @@ def object_hook(obj):
     elif t == "ClingoMethodCall":
         return ClingoMethodCall(**obj)
     elif t == "SymbolIdentifier":
+        if symbol_table is not None and isinstance(obj["symbol"], int):
+            obj["symbol"] = symbol_table.lookup(obj["symbol"])
         return SymbolIdentifier(**obj)
     elif t == "Transformer":
         return reconstruct_transformer(obj)
     return obj
 
 
+def atoms_from_symbol_ids(ids: Iterable[int],
+                          diff: Iterable[SymbolIdentifier], node_uuid: str,
+                          symbol_table: SymbolTable) -> List[SymbolIdentifier]:
+    """
+    Rebuild the atoms of a node from their symbol ids.
+    Atoms that are in the diff reuse its SymbolIdentifiers, all others get
+    a uuid derived from the node, so repeated loads agree on it.
+    """
+    in_diff = {s.symbol: s for s in diff}
+    atoms = []
+    for id in ids:
+        symbol = symbol_table.lookup(id)
+        if symbol in in_diff:
+            atoms.append(in_diff[symbol])
+        else:
+            atoms.append(
+                SymbolIdentifier(symbol,
+                                 uuid=derived_atom_uuid(node_uuid, symbol)))
+    return atoms
+
+
+def derived_atom_uuid(node_uuid: Union[UUID, str], symbol: Symbol) -> str:
+    if isinstance(node_uuid, UUID):
+        node_uuid = node_uuid.hex
+    return uuid5(NAMESPACE_URL, f"{node_uuid}/{symbol}").hex
+
+
+def transport_atoms(node: Node) -> List[SymbolIdentifier]:
+    """
+    Return the atoms of the node as they are sent to the frontend.
+    Derived atoms share their SymbolIdentifiers with the ancestors, so the
+    ones not in the diff get their own uuid, derived from the node.
+    """
+    if node.parent is None:
+        return list(node.atoms)
+    return [
+        a if a in node.diff else SymbolIdentifier(
+            a.symbol, uuid=derived_atom_uuid(node.uuid, a.symbol))
+        for a in node.atoms
+    ]
+
+
+def graph_from_node_link_data(data: dict) -> nx.DiGraph:
+    """
+    Build a graph from decoded node-link data. Nodes that were stored without
+    their atoms are linked to their predecessor, so the atoms can be derived.
+    """
+    nodes = {
+        node["id"].uuid: node["id"]
+        for node in data["nodes"] if isinstance(node["id"], Node)
+    }
+    for link in data.get("edges", data.get("links", [])):
+        for end in ("source", "target"):
+            if isinstance(link[end], Node):
+                link[end] = nodes.get(link[end].uuid, link[end])
+        source, target = link["source"], link["target"]
+        if isinstance(target, Node) and not target.has_atoms():
+            target.parent = source
+    return nx.node_link_graph(data)
+
+
 class DataclassJSONDecoder(JSONDecoder):
-    def __init__(self, *args, **kwargs):
-        JSONDecoder.__init__(self, object_hook=object_hook, *args, **kwargs)
+    def __init__(self, *args, symbol_table: Optional[SymbolTable] = None, **kwargs):
+        hook = object_hook if symbol_table is None else partial(
+            object_hook, symbol_table=symbol_table)
+        JSONDecoder.__init__(self, object_hook=hook, *args, **kwargs)
 
 
-def dataclass_to_dict(o):
+def dataclass_to_dict(o, symbol_table: Optional[SymbolTable] = None):
     if isinstance(o, Node):
-        sorted_atoms = sorted(o.atoms, key=lambda x: x.symbol)
         sorted_diff = sorted(o.diff, key=lambda x: x.symbol)
         sorted_reason = {} if len(o.reason) == 0 else o.reason
-        return {"_type": "Node",
-                "atoms": sorted_atoms,
-                "diff": sorted_diff,
-                "reason": sorted_reason,
-                "recursive": o.recursive,
-                "uuid": o.uuid,
-                "rule_nr": o.rule_nr,
-                "space_multiplier": o.space_multiplier}
+        result = {"_type": "Node",
+                  "diff": sorted_diff,
+                  "reason": sorted_reason,
+                  "recursive": o.recursive,
+                  "uuid": o.uuid,
+                  "rule_nr": o.rule_nr,
+                  "space_multiplier": o.space_multiplier}
+        if symbol_table is None:
+            result["atoms"] = sorted(transport_atoms(o),
+                                     key=lambda x: x.symbol)
+        elif o.parent is None and o.atoms != o.diff:
+            # derived atoms are not stored, they are rebuilt on loading
+            result["atoms"] = sorted(
+                symbol_table.intern(a.symbol) for a in o.atoms)
+        return result
     elif isinstance(o, ClingraphNode):
         return {"_type": "ClingraphNode", "uuid": o.uuid}
     elif isinstance(o, TransformationError):
         return {"_type": "TransformationError", "ast": o.ast, "reason": o.reason}
     elif isinstance(o, SymbolIdentifier):
-        return {"_type": "SymbolIdentifier", "symbol": o.symbol, "has_reason": o.has_reason, "uuid": o.uuid}
+        symbol = o.symbol if symbol_table is None else symbol_table.intern(o.symbol)
+        return {"_type": "SymbolIdentifier", "symbol": symbol, "has_reason": o.has_reason, "uuid": o.uuid}
     elif isinstance(o, Signature):
         return {"_type": "Signature", "name": o.name, "args": o.args}
     elif isinstance(o, Transformation):
@@ -138,14 +274,18 @@ def dataclass_to_dict(o):
 
 
 class DataclassJSONEncoder(JSONEncoder):
+    def __init__(self, *args, symbol_table: Optional[SymbolTable] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.symbol_table = symbol_table
+
     def default(self, o):
-        encoded = encode_object(o)
+        encoded = encode_object(o, self.symbol_table)
         if encoded is not None:
             return encoded
         return super().default(o)
 
 
-def encode_object(o):
+def encode_object(o, symbol_table: Optional[SymbolTable] = None):
     if isinstance(o, clingo_Model):
         x = model_to_dict(o)
         return x
@@ -158,12 +298,14 @@ def encode_object(o):
     elif isinstance(o, ModelType):
         return {"_type": "ModelType", "__enum__": str(o)}
     elif isinstance(o, Symbol):
+        if symbol_table is not None:
+            return {"_type": "SymbolRef", "id": symbol_table.intern(o)}
         x = symbol_to_dict(o)
         return x
     elif isinstance(o, FailedReason):
         return {"_type": "FailedReason", "value": o.value}
-    elif is_dataclass(o):
-        result = dataclass_to_dict(o)
+    elif is_dataclass(o) or isinstance(o, (Node, SymbolIdentifier)):
+        result = dataclass_to_dict(o, symbol_table)
         return result
     elif isinstance(o, nx.Graph):
         return {"_type": "Graph", "_graph": nx.node_link_data(o)}
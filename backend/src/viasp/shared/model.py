@@ -3,55 +3,157 @@ from dataclasses import dataclass, field
 from enum import Enum
 from inspect import Signature as inspect_Signature
 from re import U
-from typing import Any, Sequence, Dict, Union, FrozenSet, Collection, List, Tuple
+from typing import Any, Sequence, Dict, Union, FrozenSet, Collection, List, Tuple, Optional
 from types import MappingProxyType
 from uuid import UUID, uuid4
+from itertools import count
+import os
 import networkx as nx
 
 from clingo import Symbol, ModelType
 from clingo.ast import AST, Transformer
 from .util import DefaultMappingProxyType, hash_transformation_rules, get_rules_from_input_program, get_ast_from_input_string
 
-@dataclass()
+_uuid_prefix = int.from_bytes(os.urandom(8), "big")
+_uuid_counter = count()
+
+
+def _reseed_uuids():
+    global _uuid_prefix, _uuid_counter
+    _uuid_prefix = int.from_bytes(os.urandom(8), "big")
+    _uuid_counter = count()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_uuids)
+
+
+def new_uuid() -> UUID:
+    """
+    Return a new UUID for a node or symbol. A random per-process prefix
+    followed by a counter is unique like uuid4, without reading random bytes
+    for every single id.
+    """
+    return UUID(int=(_uuid_prefix << 64) | next(_uuid_counter))
+
+
 class SymbolIdentifier:
-    symbol: Symbol = field(hash=True)
-    has_reason: bool = field(default=False, hash=False)
-    uuid: UUID = field(default_factory=uuid4, hash=False)
+    __slots__ = ("symbol", "has_reason", "uuid", "_hash")
+
+    def __init__(self, symbol: Symbol, has_reason: bool = False,
+                 uuid: Optional[Union[UUID, str]] = None):
+        self.symbol = symbol
+        self.has_reason = has_reason
+        self.uuid = new_uuid() if uuid is None else uuid
+        self._hash = hash(symbol)
 
     def __eq__(self, other):
         if isinstance(other, SymbolIdentifier):
             return self.symbol == other.symbol
         elif isinstance(other, Symbol):
             return self.symbol == other
+        return NotImplemented
 
     def __hash__(self):
-        return hash(self.symbol)
+        return self._hash
 
     def __repr__(self):
         return f"{{symbol: {str(self.symbol)}, uuid: {self.uuid}}}"
 
 
-@dataclass()
 class Node:
-    diff: FrozenSet[SymbolIdentifier] = field(hash=True)
-    rule_nr: int = field(hash=True)
-    atoms: FrozenSet[SymbolIdentifier] = field(default_factory=frozenset, hash=True)
-    reason: Union[
-        Dict[str, List[Symbol]],
-        MappingProxyType] \
-        = field(default_factory=DefaultMappingProxyType, hash=True)
-    recursive: List = field(default_factory=list, hash=False)
-    space_multiplier: float = field(default=1.0, hash=False)
-    uuid: UUID = field(default_factory=uuid4, hash=False)
+    __slots__ = ("diff", "rule_nr", "_atoms", "reason", "recursive",
+                 "space_multiplier", "uuid", "parent", "_hash")
+
+    def __init__(self,
+                 diff: FrozenSet[SymbolIdentifier],
+                 rule_nr: int,
+                 atoms: FrozenSet[SymbolIdentifier] = frozenset(),
+                 reason: Optional[Union[Dict[str, List[Symbol]],
+                                        MappingProxyType]] = None,
+                 recursive: Optional[List] = None,
+                 space_multiplier: float = 1.0,
+                 uuid: Optional[Union[UUID, str]] = None,
+                 parent: Optional["Node"] = None):
+        self.diff = diff
+        self.rule_nr = rule_nr
+        # an empty atoms set is rebuilt from the diff and the parent's atoms
+        # on first access
+        self._atoms: Optional[FrozenSet[SymbolIdentifier]] = atoms or None
+        self.reason = DefaultMappingProxyType() if reason is None else reason
+        self.recursive = [] if recursive is None else recursive
+        self.space_multiplier = space_multiplier
+        self.uuid = new_uuid() if uuid is None else uuid
+        self.parent = parent
+        self._hash: Optional[int] = None
+
+    @property
+    def atoms(self) -> FrozenSet[SymbolIdentifier]:
+        if self._atoms is None:
+            return self._derive_atoms()
+        return self._atoms
+
+    @atoms.setter
+    def atoms(self, atoms: FrozenSet[SymbolIdentifier]):
+        self._atoms = atoms
+        self._hash = None
+
+    def has_atoms(self) -> bool:
+        """
+        Whether the atoms are stored or already derived from the parent.
+        """
+        return self._atoms is not None
+
+    def _derive_atoms(self) -> FrozenSet[SymbolIdentifier]:
+        """
+        Compute the atoms as the union of the diff and the atoms of the parent.
+        The ancestors are walked iteratively and every result is cached, so
+        the SymbolIdentifiers are shared along the path instead of copied.
+        """
+        pending = []
+        node: Optional[Node] = self
+        while node is not None and node._atoms is None:
+            pending.append(node)
+            node = node.parent
+        atoms = frozenset() if node is None else node._atoms
+        for node in reversed(pending):
+            atoms = frozenset(node.diff).union(atoms)
+            node._atoms = atoms
+        return atoms
 
     def __hash__(self):
-        return hash((self.atoms, self.rule_nr, self.diff))
+        """
+        Hash the node by its parent, rule and diff, so the atoms are not
+        built for it. Only a node without a parent is hashed by its atoms.
+        """
+        if self._hash is None:
+            pending = []
+            node: Optional[Node] = self
+            while node is not None and node._hash is None:
+                pending.append(node)
+                node = node.parent
+            for node in reversed(pending):
+                if node.parent is None:
+                    node._hash = hash((node.atoms, node.rule_nr, node.diff))
+                else:
+                    node._hash = hash((node.parent._hash, node.rule_nr, node.diff))
+        return self._hash
 
     def __eq__(self, o):
-        return isinstance(o, type(self)) and (
-            self.atoms, self.rule_nr, self.diff, self.reason,
-            self.space_multiplier) == (o.atoms, o.rule_nr, o.diff, o.reason,
-                                       o.space_multiplier)
+        if self is o:
+            return True
+        if not isinstance(o, type(self)) or hash(self) != hash(o):
+            return False
+        if (self.reason, self.space_multiplier) != (o.reason, o.space_multiplier):
+            return False
+        a, b = self, o
+        while a is not b:
+            if a.rule_nr != b.rule_nr or a.diff != b.diff:
+                return False
+            if a.parent is None or b.parent is None:
+                return a.parent is None and b.parent is None and a.atoms == b.atoms
+            a, b = a.parent, b.parent
+        return True
 
     def __repr__(self):
         repr_reasons = []
@@ -95,7 +197,14 @@ class RuleContainer:
             self.str_ = tuple(get_rules_from_input_program(self.ast))
         if len(self.ast) == 0 and len(self.str_) > 0:
             self.ast = tuple(get_ast_from_input_string(self.str_))
-    
+        self._hash = ""
+
+    @property
+    def hash(self) -> str:
+        if self._hash == "":
+            self._hash = hash_transformation_rules(self.ast)
+        return self._hash
+
     def __hash__(self):
         return hash(self.ast)
 
@@ -121,7 +230,7 @@ class Transformation:
         if isinstance(self.rules, Tuple):
             self.rules = RuleContainer(ast=self.rules)
         if self.hash == "":
-            self.hash = hash_transformation_rules(self.rules.ast)
+            self.hash = self.rules.hash
 
     def __hash__(self):
         return hash(self.rules.ast)
@@ -2,8 +2,8 @@ from itertools import tee
 from typing import Any, TypeVar, Iterable, Tuple, List, Sequence, Dict
 from collections import defaultdict
 from types import MappingProxyType
-from hashlib import sha1
-from flask import current_app, session
+from hashlib import blake2b
+from flask import session
 from uuid import uuid4
 import json
 import jsonschema
@@ -13,6 +13,7 @@ from clingo.ast import ASTType, AST, parse_string
 import jsonschema.exceptions
 import networkx as nx
 from ..exceptions import InvalidSyntax, InvalidSyntaxJSON
+from .defaults import HASH_DIGEST_SIZE
 from .simple_logging import warn
 
 
@@ -74,48 +75,68 @@ def is_recursive(node, graph):
 
 
 def hash_from_sorted_transformations(sorted_program: List) -> str:
-    hashes = [s.hash for s in sorted_program]
-    concatenated = "".join(hashes)
-    hash_object = sha1(concatenated.encode())
+    hash_object = blake2b(digest_size=HASH_DIGEST_SIZE)
+    for s in sorted_program:
+        hash_object.update(s.hash.encode())
     return hash_object.hexdigest()
 
 def hash_transformation_rules(rules: Tuple[Any, ...]) -> str:
-    hash_object = sha1()
+    """
+    Hash the rules by their text, so rules given as strings and their ASTs
+    have the same hash.
+    """
+    hash_object = blake2b(digest_size=HASH_DIGEST_SIZE)
     for rule in rules:
-        rule_str = current_app.json.dumps(rule)
-        rule_hash = sha1(rule_str.encode()).hexdigest()
-        hash_object.update(rule_hash.encode())
+        rule_hash = blake2b(str(rule).encode(), digest_size=HASH_DIGEST_SIZE)
+        hash_object.update(rule_hash.digest())
     return hash_object.hexdigest()
 
 
 def get_rules_from_input_program(rules: Tuple) -> Sequence[str]:
-    from ..server.database import get_database, get_or_create_encoding_id
+    """
+    Return the texts of the rules as they are written in the stored program.
+    The lines of the program and the texts are cached per encoding, so the
+    database is only read again after the program changed.
+    """
+    from ..server.database import get_database, get_or_create_encoding_id, program_cache
 
     rules_from_input_program: Sequence[str] = []
     encoding_id = get_or_create_encoding_id()
-    db = get_database()
-    program = db.load_program(encoding_id).split("\n")
+    program = program_cache.get_lines(encoding_id)
+    if program is None:
+        get_database().load_program(encoding_id)
+        program = program_cache.get_lines(encoding_id) or [""]
+    rule_texts = program_cache.get_rule_texts(encoding_id)
     for rule in rules:
         if isinstance(rule, str):
             rules_from_input_program.append(rule)
             continue
-        begin_line = rule.location.begin.line
-        begin_colu = rule.location.begin.column
-        end_line = rule.location.end.line
-        end_colu = rule.location.end.column
-        r = ""
-        if begin_line != end_line:
-            r += program[begin_line - 1][begin_colu-1:] + "\n"
-            for i in range(begin_line, end_line - 1):
-                r += program[i] + "\n"
-            r += program[end_line - 1][:end_colu]
-        else:
-            r += program[begin_line - 1][begin_colu - 1:end_colu-1]
-        r = append_hashtag_to_minimize(r, rule, program, begin_line, begin_colu)
+        location = (rule.location.begin.line, rule.location.begin.column,
+                    rule.location.end.line, rule.location.end.column,
+                    rule.ast_type == ASTType.Minimize)
+        r = rule_texts.get(location)
+        if r is None:
+            r = rule_texts[location] = get_rule_from_program_lines(rule, program)
         rules_from_input_program.append(r)
     return rules_from_input_program
 
 
+def get_rule_from_program_lines(rule: AST, program: Sequence[str]) -> str:
+    begin_line = rule.location.begin.line
+    begin_colu = rule.location.begin.column
+    end_line = rule.location.end.line
+    end_colu = rule.location.end.column
+    r = ""
+    if begin_line != end_line:
+        r += program[begin_line - 1][begin_colu-1:] + "\n"
+        for i in range(begin_line, end_line - 1):
+            r += program[i] + "\n"
+        r += program[end_line - 1][:end_colu]
+    else:
+        r += program[begin_line - 1][begin_colu - 1:end_colu-1]
+    return append_hashtag_to_minimize(r, rule, program, begin_line, begin_colu)
+
+
 def append_hashtag_to_minimize(r: str, rule: AST, program: Sequence[str], begin_line: int, begin_colu: int) -> str:
     if rule.ast_type == ASTType.Minimize and r[:2] != ":~":
         for i in range(begin_line, 0, -1):
@@ -133,6 +133,8 @@ class Control:
             del kwargs["_viasp_client"]
         if "viasp_backend_url" in kwargs:
             del kwargs["viasp_backend_url"]
+        if "viasp_encoding_id" in kwargs:
+            del kwargs["viasp_encoding_id"]
 
         self.viasp.register_function_call(
             "__init__", signature(self.passed_control.__init__), args, kwargs)
@@ -1,3 +1,4 @@
+from viasp.shared.defaults import ENCODING_ID_HEADER
 from helper import get_clingo_stable_models
 
 def test_add_call_endpoint(client, clingo_call_run_sample):
@@ -46,3 +47,69 @@ def test_show_endpoint(client):
     res = client.get("/graph")
     assert len(list(res.json.nodes)) > 0
 
+
+
+def test_sessions_are_isolated(client):
+    res = client.post("/control/session")
+    assert res.status_code == 200
+    session_id = res.json["encoding_id"]
+    other = {ENCODING_ID_HEADER: "other"}
+    client.post("/control/models/clear", headers=other)
+
+    client.post("/control/models", json=get_clingo_stable_models("{b;c}."))
+    assert len(client.get("/control/models").json) == 4
+    assert len(client.get("/control/models", headers=other).json) == 0
+    res = client.get("/control/models",
+                     headers={ENCODING_ID_HEADER: session_id})
+    assert len(res.json) == 4
+    client.post("/control/models", json=get_clingo_stable_models("{b}."), headers=other)
+    assert len(client.get("/control/models").json) == 4
+    assert len(client.get("/control/models", headers=other).json) == 2
+
+
+def test_sessions_are_shown_concurrently(client):
+    import threading
+    from viasp.server.database import GraphAccessor
+    app = client.application
+    results = []
+
+    def show(encoding_id):
+        program = f"{{b;c}}. d :- b. {encoding_id} :- c, d."
+        client = app.test_client()
+        headers = {ENCODING_ID_HEADER: encoding_id}
+        GraphAccessor().save_program(program, encoding_id)
+        client.post("/control/models", json=get_clingo_stable_models(program), headers=headers)
+        for _ in range(3):
+            results.append(client.post("/control/show", headers=headers).status_code)
+
+    threads = [threading.Thread(target=show, args=(f"concurrent{i}", )) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [200] * 12
+    for i in range(4):
+        res = client.get("/graph", headers={ENCODING_ID_HEADER: f"concurrent{i}"})
+        assert len(list(res.json.nodes)) > 0
+
+
+def test_idle_sessions_expire(client, clingo_call_run_sample):
+    from viasp.server.blueprints.api import sessions, expire_sessions
+    from viasp.shared.event import REGISTRY, Event
+    headers = {ENCODING_ID_HEADER: "idle"}
+    from dataclasses import replace
+    from uuid import uuid4
+    idle_calls = [replace(call, uuid=uuid4()) for call in clingo_call_run_sample]
+    client.post("/control/add_call", json=idle_calls, headers=headers)
+    client.post("/control/add_call", json=clingo_call_run_sample)
+    session = sessions["idle"]
+    assert session.calls.mark_call_as_used in REGISTRY[Event.CALL_EXECUTED]
+    assert len(session.calls.get_pending()) == 4
+
+    client.get("/control/reconstruct")
+    assert len(session.calls.get_pending()) == 4
+
+    expire_sessions(timeout=-1)
+    assert "idle" not in sessions
+    assert "0" in sessions
+    assert session.calls.mark_call_as_used not in REGISTRY[Event.CALL_EXECUTED]
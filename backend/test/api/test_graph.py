@@ -1,3 +1,6 @@
+import pytest
+
+from viasp.server.database import GraphAccessor, DEFAULT_ENCODING_ID
 from viasp.shared.model import Node, Transformation
 
 def test_clear_empty_graph(client_with_a_graph):
@@ -103,3 +106,59 @@ def test_get_transformations(client_with_a_graph):
     assert res.status_code == 200
     assert type(res.json) == list
     assert len(res.json) == 2
+
+
+def test_node_lookups_match_graph(client_with_a_graph):
+    client, _, _, _ = client_with_a_graph
+    graph = client.get("/graph").json
+    for node in graph.nodes:
+        res = client.get(f"/graph/model/{node.uuid}")
+        assert res.status_code == 200
+        assert res.json.uuid == node.uuid
+        assert res.json.diff == node.diff
+        assert {a.uuid for a in res.json.atoms} == {a.uuid for a in node.atoms}
+        res = client.get(f"/detail/{node.uuid}")
+        assert res.status_code == 200
+        expected = "Facts" if graph.in_degree(node) == 0 and graph.out_degree(node) > 0 else "Answer Set"
+        assert res.json[0] == expected
+        for subnode in node.recursive:
+            res = client.get(f"/detail/{subnode.uuid}")
+            assert res.status_code == 200
+            assert res.json[0] == "Model"
+        for symbol in node.diff:
+            res = client.post("/graph/reason", json={"sourceid": symbol.uuid, "nodeid": node.uuid})
+            assert res.status_code == 200
+            assert len(res.json) == len(node.reason.get(str(symbol.symbol), []))
+
+
+@pytest.mark.parametrize("client_with_a_graph", ["program_multiple_sorts"], indirect=True)
+def test_moving_a_transformation_relates_the_sorts(client_with_a_graph):
+    client, _, _, _ = client_with_a_graph
+    sort = client.get("graph/transformations").json
+    t = sort[0]
+    assert t.adjacent_sort_indices["upper_bound"] == 1
+    primary_hash = client.get("graph/sorts").json
+    res = client.post("graph/sorts", json={"moved_transformation": {"old_index": 0, "new_index": 1}})
+    assert res.status_code == 200
+    hash = res.json["hash"]
+    assert hash != primary_hash
+    assert client.get("graph/sorts").json == hash
+    moved = client.get("graph/transformations").json
+    assert moved[1].rules == t.rules
+    assert GraphAccessor().get_adjacent_graphs_hashes(primary_hash, DEFAULT_ENCODING_ID) == [hash]
+
+
+@pytest.mark.parametrize("client_with_a_graph", ["program_independent_rules"], indirect=True)
+def test_only_visited_sorts_are_related(client_with_a_graph):
+    client, _, _, _ = client_with_a_graph
+    sort = client.get("graph/transformations").json
+    assert len(sort) == 3
+    assert all(t.adjacent_sort_indices == {"lower_bound": 0, "upper_bound": 2} for t in sort)
+    primary_hash = client.get("graph/sorts").json
+    assert GraphAccessor().get_adjacent_graphs_hashes(primary_hash, DEFAULT_ENCODING_ID) == []
+
+    res = client.post("graph/sorts", json={"moved_transformation": {"old_index": 0, "new_index": 2}})
+    assert res.status_code == 200
+    hash = res.json["hash"]
+    assert GraphAccessor().get_adjacent_graphs_hashes(primary_hash, DEFAULT_ENCODING_ID) == [hash]
+    assert GraphAccessor().get_adjacent_graphs_hashes(hash, DEFAULT_ENCODING_ID) == [primary_hash]
@@ -54,7 +54,7 @@ def load_analyzer(app_context) -> Callable[[str], ProgramAnalyzer]:
     def c(program: str) -> ProgramAnalyzer:
         encoding_id = "0"
         db = GraphAccessor()
-        db.clear()
+        db.clear_all()
         db.add_to_program(program, encoding_id)
         analyzer = ProgramAnalyzer()
         analyzer.add_program(db.load_program(encoding_id))
@@ -99,6 +99,10 @@ def program_simple() -> str:
 def program_multiple_sorts() -> str:
     return "a(1..2). {b(X)} :- a(X). c(X) :- a(X)."
 
+@pytest.fixture
+def program_independent_rules() -> str:
+    return "a(1..2). {b(X)} :- a(X). c(X) :- a(X). d(X) :- a(X)."
+
 @pytest.fixture
 def program_recursive() -> str:
     return "j(X, X+1) :- X=0..5.j(X,  Y) :- j(X,Z), j(Z,Y)."
@@ -181,7 +185,8 @@ def cleanup(request):
         import shutil
         if os.path.exists(CLINGRAPH_PATH):
             shutil.rmtree(CLINGRAPH_PATH)
-        for file in [GRAPH_PATH, PROGRAM_STORAGE_PATH, STDIN_TMP_STORAGE_PATH]:
+        for file in [GRAPH_PATH, f"{GRAPH_PATH}-wal", f"{GRAPH_PATH}-shm",
+                     PROGRAM_STORAGE_PATH, STDIN_TMP_STORAGE_PATH]:
             if os.path.exists(file):
                 os.remove(file)
 
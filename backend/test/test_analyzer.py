@@ -503,3 +503,82 @@ def test_signature_conditional_literal():
     assert make_signature(literals[1]) == ('b', 1)
     assert make_signature(literals[2]) == ('c', 1)
     # signature of the conditional literal itself
+
+
+def test_rule_hashes_are_cached_without_app_context(monkeypatch):
+    import viasp.shared.model
+    from viasp.shared.model import RuleContainer, Transformation
+    rules = RuleContainer(str_=("a :- b.", "b :- a."))
+    assert rules.hash == hash_transformation_rules(("a :- b.", "b :- a."))
+    assert rules.hash != RuleContainer(str_=("b :- a.", "a :- b.")).hash
+
+    def fail(*_):
+        raise AssertionError("The rules should only be hashed once.")
+    monkeypatch.setattr(viasp.shared.model, "hash_transformation_rules", fail)
+    assert Transformation(0, rules).hash == rules.hash
+
+
+def test_program_is_analyzed_once(app_context, monkeypatch):
+    from viasp.asp.reify import analyze_program, analysis_cache
+    program = "a(1). b(X) :- a(X). a(X+1) :- b(X), X < 3."
+    db = GraphAccessor()
+    db.save_program(program, get_or_create_encoding_id())
+    analysis_cache.clear()
+    loaded = []
+
+    def load_transformer():
+        loaded.append(True)
+        return None
+    first = analyze_program(program, "", load_transformer)
+    sorted_program = first.primary_sort_program_by_dependencies()
+    recursion = first.check_positive_recursion()
+
+    def fail(*_):
+        raise AssertionError("The program should only be analyzed once.")
+    monkeypatch.setattr(ProgramAnalyzer, "visit", fail)
+    monkeypatch.setattr(ProgramAnalyzer, "_check_positive_recursion", fail)
+    second = analyze_program(program, "", load_transformer)
+    assert second is not first
+    assert second.primary_sort_program_by_dependencies() == sorted_program
+    assert second.dependency_graph is not None
+    assert second.check_positive_recursion() == recursion
+    assert len(loaded) == 1
+    assert (analysis_cache.hits, analysis_cache.misses) == (1, 1)
+
+    monkeypatch.undo()
+    analyze_program(program, "transformer", load_transformer)
+    assert len(loaded) == 2
+
+
+def test_program_analysis_is_stored(app_context, monkeypatch):
+    from viasp.asp.reify import analyze_program, analysis_cache
+    from viasp.server.database import load_analysis, save_analysis
+    program = "#const n = 3. #defined e/1. a(1). b(X) :- a(X). a(X+1) :- b(X), X < n. c :- e(1)."
+    db = GraphAccessor()
+    db.clear_all()
+    db.save_program(program, get_or_create_encoding_id())
+    analysis_cache.clear()
+    first = analyze_program(program, "", lambda: None, load_analysis, save_analysis)
+    sorted_program = first.get_sorted_program()
+
+    def fail(*_):
+        raise AssertionError("The stored analysis should be used.")
+    analysis_cache.clear()
+    monkeypatch.setattr(ProgramAnalyzer, "visit", fail)
+    monkeypatch.setattr(ProgramAnalyzer, "_check_positive_recursion", fail)
+    second = analyze_program(program, "", fail, load_analysis, save_analysis)
+    assert analysis_cache.misses == 1
+    assert second.get_sorted_program() == sorted_program
+    assert [t.adjacent_sort_indices for t in second.get_sorted_program()] == \
+        [t.adjacent_sort_indices for t in sorted_program]
+    assert set(second.dependency_graph.nodes) == set(first.dependency_graph.nodes)
+    assert second.check_positive_recursion() == first.check_positive_recursion()
+    assert sorted(map(str, second.get_facts())) == sorted(map(str, first.get_facts()))
+    assert sorted(map(str, second.get_constants())) == sorted(map(str, first.get_constants()))
+    assert second.pass_through == first.pass_through
+    assert second.names == first.names
+    assert second.will_work()
+    assert second.get_conflict_free_h() == first.get_conflict_free_h()
+
+    monkeypatch.undo()
+    assert load_analysis(*analysis_cache.store_key(program, "transformer")) is None
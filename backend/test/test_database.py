@@ -1,4 +1,6 @@
-from viasp.server.database import CallCenter, GraphAccessor
+from viasp.server.database import CallCenter, GraphAccessor, GraphCache, graph_cache, program_cache, MIGRATIONS
+import threading
+import clingo
 import pytest
 from typing import Tuple, List
 import networkx as nx
@@ -7,6 +9,7 @@ from helper import get_clingo_stable_models
 from viasp.shared.util import hash_from_sorted_transformations, hash_transformation_rules
 from viasp.shared.model import Transformation, TransformerTransport, TransformationError, FailedReason, RuleContainer
 from viasp.exampleTransformer import Transformer as ExampleTransfomer
+from viasp.shared.event import Event, subscribe, unsubscribe
 
 
 @pytest.fixture(
@@ -32,6 +35,56 @@ def test_add_a_call_to_database(clingo_call_run_sample):
     assert len(db.get_pending()) == 3, "Database should contain 3 pending after adding 4 and consuming one."
 
 
+def test_connections_are_reused_per_thread():
+    db1 = GraphAccessor()
+    db2 = GraphAccessor()
+    assert db1.conn is db2.conn
+    assert db1.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db1.conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    assert db1.conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(GraphAccessor().conn))
+    thread.start()
+    thread.join()
+    assert other[0] is not db1.conn
+
+
+def test_old_databases_are_migrated(tmp_path):
+    import sqlite3
+    from viasp.server.database import _setup_schema
+    conn = sqlite3.connect(str(tmp_path / "old.db"))
+    for statements in MIGRATIONS[:4]:
+        for statement in statements:
+            conn.execute(statement)
+    conn.execute("PRAGMA user_version = 4")
+    conn.commit()
+
+    _setup_schema(conn)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"nodes", "node_symbols", "symbols"} <= tables
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    conn.close()
+
+
+def test_connections_are_closed_with_their_thread():
+    import gc
+    import sqlite3
+    from viasp.server.database import connections
+    GraphAccessor()
+    before = connections.open_connections()
+
+    opened = []
+    threads = [threading.Thread(target=lambda: opened.append(GraphAccessor().conn)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    gc.collect()
+    assert connections.open_connections() == before
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].execute("SELECT 1")
+
+
 def test_program_database():
     db = GraphAccessor()
     encoding_id = "test"
@@ -45,6 +98,51 @@ def test_program_database():
     db.clear_program(encoding_id)
     assert len(db.load_program(encoding_id)) == 0, "Database should be empty after clearing."
 
+
+def test_program_is_stored_in_chunks():
+    db = GraphAccessor()
+    encoding_id = "chunks"
+    chunks = [f'a({i}, "{"ä" * (i % 3)}").' for i in range(100)]
+    db.clear_program(encoding_id)
+    for chunk in chunks:
+        db.add_to_program(chunk, encoding_id)
+    assert db.load_program(encoding_id) == "".join(chunks)
+
+    rows = db.conn.execute(
+        "SELECT start, chunk FROM program_chunks WHERE encoding_id = ? ORDER BY position",
+        (encoding_id, )).fetchall()
+    program = "".join(chunks)
+    encoded = program.encode()
+    assert [encoded[start:start + len(chunk.encode())].decode()
+            for start, chunk in rows] == chunks
+    program_cache.clear()
+    assert db.load_program(encoding_id) == program
+    db.clear_program(encoding_id)
+
+def test_program_changes_are_published_after_the_commit():
+    db = GraphAccessor()
+    encoding_id = "published"
+    db.clear_program(encoding_id)
+    db.add_to_program("a.", encoding_id)
+    assert db.load_program(encoding_id) == "a."
+    published = []
+
+    def record(encoding_id, **_):
+        published.append((encoding_id, program_cache.get(encoding_id)))
+
+    subscribe(Event.PROGRAM_CHANGED, record)
+    try:
+        with db.transaction():
+            db.add_to_program("b.", encoding_id)
+            assert db.load_program(encoding_id) == "a.b."
+            assert program_cache.get(encoding_id) == "a."
+            assert published == []
+        assert published == [(encoding_id, "a.b.")]
+    finally:
+        unsubscribe(Event.PROGRAM_CHANGED, record)
+    db.clear_program(encoding_id)
+
+
 def test_models_database(client_with_a_graph):
     db = GraphAccessor()
     encoding_id = "test"
@@ -81,6 +179,58 @@ def test_graph_database(graph_info):
     assert len(r) > 0
 
 
+def test_graph_cache_database(graph_info):
+    db = GraphAccessor()
+    encoding_id = "test"
+
+    db.save_graph(graph_info[0], graph_info[1], graph_info[2], encoding_id)
+    hits = graph_cache.hits
+    first = db.load_graph(graph_info[1], encoding_id)
+    second = db.load_graph(graph_info[1], encoding_id)
+    assert first is second
+    assert graph_cache.hits == hits + 1
+
+    db.save_graph(graph_info[0], graph_info[1], graph_info[2], encoding_id)
+    assert db.load_graph(graph_info[1], encoding_id) is not first
+    db.clear(encoding_id)
+    with pytest.raises(KeyError):
+        db.load_graph(graph_info[1], encoding_id)
+
+
+def test_clearing_an_encoding_keeps_the_others(graph_info):
+    db = GraphAccessor()
+    graph, hash, sort = graph_info
+    for encoding_id in ("cleared", "kept"):
+        db.save_program("a.", encoding_id)
+        db.save_graph(graph, f"{encoding_id}{hash}", sort, encoding_id)
+        db.set_current_graph(f"{encoding_id}{hash}", encoding_id)
+
+    db.clear("cleared")
+    assert db.load_program("cleared") == ""
+    with pytest.raises(KeyError):
+        db.load_graph_json(f"cleared{hash}", "cleared")
+    assert db.load_program("kept") == "a."
+    assert len(db.load_graph(f"kept{hash}", "kept")) == len(graph)
+    assert db.get_current_graph_hash("kept") == f"kept{hash}"
+    db.clear("kept")
+
+
+def test_graph_cache_eviction():
+    cache = GraphCache(max_entries=2, max_bytes=10)
+    graphs = [nx.DiGraph() for _ in range(3)]
+    cache.put("a", "test", graphs[0], 4)
+    cache.put("b", "test", graphs[1], 4)
+    assert cache.get("a", "test") is graphs[0]
+    cache.put("c", "test", graphs[2], 4)
+    assert cache.get("b", "test") is None
+    assert cache.get("a", "test") is graphs[0]
+    assert cache.stats()["bytes"] == 8
+    cache.put("d", "test", nx.DiGraph(), 11)
+    assert cache.get("d", "test") is None
+    cache.invalidate_encoding("test")
+    assert cache.stats()["entries"] == 0
+
+
 def test_current_graph_json_database(graph_info):
     db = GraphAccessor()
     encoding_id = "test"
@@ -265,6 +415,143 @@ def test_related_graphs(app_context):
     assert hash_1 in r
 
 
+def test_transactions_commit_once(app_context):
+    db = GraphAccessor()
+    encoding_id = "transactions"
+    elements = ['x:-a.', 'y:-a.', 'z:-a.']
+    sorts = [(f"transaction{i}", [
+        Transformation(j, RuleContainer(str_=(elements[(i + j) % len(elements)], )))
+        for j in range(len(elements))
+    ]) for i in range(len(elements))]
+
+    with db.transaction():
+        db.save_sort("hash", sorts[0][1], encoding_id)
+        with db.transaction():
+            db.insert_graph_adjacencies("hash", sorts, encoding_id)
+            db.save_warnings([TransformationError(RuleContainer(str_=("x:-a.",)).ast[0], FailedReason.FAILURE)], encoding_id)
+        assert db.conn.in_transaction
+    assert not db.conn.in_transaction
+    assert set(db.get_adjacent_graphs_hashes("hash", encoding_id)) == {h for h, _ in sorts}
+    assert len(db.load_warnings(encoding_id)) == 1
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.clear_warnings(encoding_id)
+            db.clear_all_sorts(encoding_id)
+            raise RuntimeError()
+    assert not db.conn.in_transaction
+    assert len(db.load_warnings(encoding_id)) == 1
+    assert len(db.load_all_sorts(encoding_id)) == len(sorts) + 1
+
+
+def test_rolling_back_keeps_the_state_of_other_encodings(graph_info):
+    db = GraphAccessor()
+    graph, hash, sort = graph_info
+    db.clear("rolled back")
+    db.clear("kept")
+    db.add_to_program("a.", "kept")
+    assert db.load_program("kept") == "a."
+    kept = db.get_symbol_table("kept")
+    kept.intern(clingo.Function("pending"))
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.save_graph(graph, f"rolled back{hash}", sort, "rolled back")
+            raise RuntimeError()
+    assert program_cache.get("kept") == "a."
+    assert db.get_symbol_table("kept") is kept
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.clear_program("kept")
+            raise RuntimeError()
+    assert db.load_program("kept") == "a."
+    assert [symbol for _, symbol in kept.take_pending()] == ["pending"]
+    assert len(db.get_symbol_table("rolled back")) > 0
+
+    db.save_graph(graph, f"rolled back{hash}", sort, "rolled back")
+    db.cursor.execute("SELECT count(*) FROM symbols WHERE encoding_id = ?",
+                      ("rolled back", ))
+    assert db.cursor.fetchone()[0] == len(db.get_symbol_table("rolled back"))
+
+
+def test_queries_use_indexes(graph_info):
+    db = GraphAccessor()
+    encoding_id = "plans"
+    graph, hash, sort = graph_info
+    node = next(iter(graph.nodes))
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    try:
+        db.save_program("a.", encoding_id)
+        db.load_program(encoding_id)
+        db.set_models(["a."], encoding_id)
+        db.load_models(encoding_id)
+        db.save_graph(graph, hash, sort, encoding_id)
+        db.set_current_graph(hash, encoding_id)
+        db.load_current_graph_json(encoding_id)
+        db.get_current_sort(encoding_id)
+        db.load_all_sorts(encoding_id)
+        db.load_node(node.uuid.hex, hash, encoding_id)
+        db.load_node_kind(node.uuid.hex, hash, encoding_id)
+        db.load_symbol_of_node("", node.uuid.hex, hash, encoding_id)
+        db.insert_graph_adjacency(hash, "plans", sort, encoding_id)
+        db.get_adjacent_graphs_hashes(hash, encoding_id)
+        db.save_recursive_transformations_hashes({"a"}, encoding_id)
+        db.load_recursive_transformations_hashes(encoding_id)
+        db.save_clingraph("plans", encoding_id)
+        db.load_all_clingraphs(encoding_id)
+        db.load_warnings(encoding_id)
+        db.load_transformer(encoding_id)
+        db.evict_graphs(0)
+        db.clear_warnings(encoding_id)
+        db.clear_clingraph(encoding_id)
+        db.clear_recursive_transformations_hashes(encoding_id)
+        db.clear_all_sorts(encoding_id)
+        db.clear_models(encoding_id)
+        db.clear_program(encoding_id)
+        db.clear(encoding_id)
+    finally:
+        db.conn.set_trace_callback(None)
+
+    tables = {
+        row[0] for row in db.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    for statement in set(statements):
+        if " WHERE " not in statement.upper():
+            continue
+        for *_, detail in db.conn.execute(f"EXPLAIN QUERY PLAN {statement}"):
+            words = detail.replace(" TABLE ", " ").split()
+            assert not (words[0] == "SCAN" and words[1] in tables
+                        and "INDEX" not in detail), f"{detail} in {statement}"
+
+
+def test_cold_graphs_are_evicted(app_context, get_sort_program_and_get_graph, program_multiple_sorts):
+    db = GraphAccessor()
+    encoding_id = "eviction"
+    graph, hash, sort = get_sort_program_and_get_graph(program_multiple_sorts)[0]
+    hashes = [f"eviction{i}" for i in range(3)]
+    for h in hashes:
+        db.save_graph(graph, h, sort, encoding_id)
+    db.set_current_graph(hashes[0], encoding_id)
+    size = db.conn.execute("SELECT size FROM graphs WHERE hash = ?", (hashes[0], )).fetchone()[0]
+    node_rows = db.conn.execute("SELECT SUM(length(data)) FROM nodes WHERE graph_hash = ?", (hashes[0], )).fetchone()[0]
+    assert size > len(db.load_graph_json(hashes[0], encoding_id)) + node_rows
+
+    assert db.evict_graphs(2 * size) == 1
+    with pytest.raises(ValueError):
+        db.load_graph(hashes[1], encoding_id)
+    for table in ("nodes", "node_symbols"):
+        assert db.conn.execute(f"SELECT COUNT(*) FROM {table} WHERE graph_hash = ?", (hashes[1], )).fetchone()[0] == 0
+    assert len(db.load_graph(hashes[2], encoding_id)) > 0
+
+    assert db.evict_graphs(0) == 1
+    assert len(db.load_graph(hashes[0], encoding_id)) > 0
+    assert len(db.load_all_sorts(encoding_id)) == len(hashes)
+    db.vacuum(interval=0)
+
+
 @pytest.mark.skip(reason="Transformer not registered bc of base exception?")
 def test_transformer_database(app_context):
     db = GraphAccessor()
@@ -278,3 +565,30 @@ def test_transformer_database(app_context):
     r = db.load_transformer(encoding_id)
     assert type(r) == ExampleTransfomer
     assert r == transformer
+
+
+def test_rule_texts_are_sliced_from_cached_lines(app_context, monkeypatch):
+    from clingo.ast import parse_string
+    from viasp.shared.util import get_rules_from_input_program
+    db = GraphAccessor()
+    encoding_id = "0"
+    program = "a.\nb :- a,\n  not c.\n:~ b. [1@0]"
+    db.clear_program(encoding_id)
+    db.add_to_program(program, encoding_id)
+    rules = []
+    parse_string(program, rules.append)
+    rules = tuple(rules[1:])
+    assert get_rules_from_input_program(rules) == ["a.", "b :- a,\n  not c.", ":~ b. [1@0]"]
+
+    def fail(*_):
+        raise AssertionError("The program should not be read again.")
+    monkeypatch.setattr(GraphAccessor, "load_program", fail)
+    assert get_rules_from_input_program(rules[1:2]) == ["b :- a,\n  not c."]
+    monkeypatch.undo()
+
+    db.clear_program(encoding_id)
+    db.add_to_program("b :- a.", encoding_id)
+    rules = []
+    parse_string("b :- a.", rules.append)
+    assert get_rules_from_input_program(tuple(rules[1:])) == ["b :- a."]
+    db.clear_program(encoding_id)
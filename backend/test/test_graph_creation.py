@@ -1,17 +1,23 @@
 from typing import List
 
 import networkx as nx
+import pytest
+from clingo import parse_term
 from clingo.ast import AST, Function, Location, Position
 
 from viasp.asp.justify import make_reason_path_from_facts_to_stable_model, \
-    get_h_symbols_from_model
+    get_h_symbols_from_model, build_graph, save_model, select_first_derivations, derivation_cache, \
+    recursion_cache, get_worker_pool, shutdown_worker_pool, get_derivations_of_models, make_justification_program
+from viasp.asp import justify
+from viasp.asp.reify import reify_list
+from viasp.asp.recursion import RecursionReasoner
 from viasp.shared.util import pairwise
 from viasp.asp.reify import transform
 from viasp.shared.model import Node, RuleContainer, Transformation, SymbolIdentifier
 from viasp.shared.util import get_start_node_from_graph, get_end_node_from_path
 
 
-from helper import get_stable_models_for_program
+from helper import get_stable_models_for_program, get_clingo_stable_models
 
 
 def test_justification_creates_a_graph_with_a_single_path(get_sort_program_and_get_graph):
@@ -175,6 +181,13 @@ def test_path_creation(app_context):
     assert all([isinstance(node, Node) for node in nodes])
 
 
+def test_only_first_derivations_are_selected():
+    h_symbols = [parse_term(s) for s in
+                 ["h(2,b,(a,))", "h(1,b,(c,))", "h(1,b,(d,))", "h(3,e,(b,))", "h(1,a,())"]]
+    selected = select_first_derivations(h_symbols, frozenset([parse_term("a")]))
+    assert sorted(map(str, selected)) == ["h(1,b,(c,))", "h(1,b,(d,))", "h(3,e,(b,))"]
+
+
 def test_atoms_are_propagated_correctly_through_diffs(app_context):
     program = "a. b :- a. c :- b. d :- c."
     loc = Location(Position("str",1,1), Position("str",1,1))
@@ -192,6 +205,22 @@ def test_atoms_are_propagated_correctly_through_diffs(app_context):
     for src, tgt in pairwise(path_list):
         assert src.diff.issubset(tgt.atoms)
         assert len(src.atoms) == len(tgt.atoms) - len(tgt.diff)
+        assert tgt.parent is src
+        assert all(any(a is b for b in tgt.atoms) for a in src.atoms)
+
+
+def test_hashing_nodes_does_not_build_their_atoms():
+    root = Node(frozenset([SymbolIdentifier(parse_term("a"))]), 0, frozenset([SymbolIdentifier(parse_term("a"))]))
+    path = [root]
+    for i, name in enumerate("bcd", start=1):
+        path.append(Node(frozenset([SymbolIdentifier(parse_term(name))]), i, parent=path[-1]))
+    same = Node(frozenset([SymbolIdentifier(parse_term("d"))]), 3, parent=path[2])
+    other = Node(frozenset([SymbolIdentifier(parse_term("d"))]), 3, parent=root)
+
+    assert len({*path, same, other}) == 5
+    assert same == path[-1]
+    assert other != path[-1]
+    assert not any(node.has_atoms() for node in path[1:] + [same, other])
 
 
 
@@ -208,3 +237,161 @@ def test_multiple_sortings_yield_primary_sort(load_analyzer):
     # assert first sorting is closest to the original program
     assert sorted_program[1] == Transformation(1, RuleContainer(str_=("c :- b.",)))
     assert sorted_program[2] == Transformation(2, RuleContainer(str_=("c :- a.",)))
+
+
+def describe_graph(graph: nx.DiGraph):
+    """
+    Summarize the nodes and edges of a graph independently of their order
+    and uuids, so that graphs built in different ways can be compared.
+    """
+    nodes = sorted((node.rule_nr,
+                    sorted(str(a.symbol) for a in node.atoms),
+                    sorted(str(a.symbol) for a in node.diff),
+                    sorted((k, sorted(str(r.symbol) for r in v)) for k, v in node.reason.items()),
+                    [sorted(str(a.symbol) for a in sub.diff) for sub in node.recursive])
+                   for node in graph.nodes)
+    edges = sorted((str(graph.edges[u, v]["transformation"].rules.str_),
+                    sorted(str(a.symbol) for a in v.atoms))
+                   for u, v in graph.edges)
+    return nodes, edges
+
+
+def test_parallel_justification_matches_sequential(get_sort_program):
+    program = "a. {b; c; d}. e(X) :- X = 1..3, b. f :- c, e(2)."
+    sorted_program, analyzer = get_sort_program(program)
+    models = [list(save_model(m)) for m in get_clingo_stable_models(program)]
+    assert len(models) >= 8
+    reified = reify_list(sorted_program)
+    recursion = analyzer.check_positive_recursion()
+
+    sequential = build_graph(models, reified, sorted_program, analyzer, recursion, workers=1, batched=False)
+    derivation_cache.clear()
+    shutdown_worker_pool()
+    parallel = build_graph(models, reified, sorted_program, analyzer, recursion, workers=2, batched=False)
+    assert justify._worker_pool is not None
+    assert describe_graph(parallel) == describe_graph(sequential)
+    pool = get_worker_pool(2)
+    derivation_cache.clear()
+    build_graph(models, reified, sorted_program, analyzer, recursion, workers=2, batched=False)
+    assert get_worker_pool(2) is pool
+
+
+def test_batched_justification_matches_per_model(get_sort_program):
+    program = "a. {b; c; d}. e(X) :- X = 1..3, b. f :- c, e(2), not d. g :- #count{X: e(X)} > 1, f."
+    sorted_program, analyzer = get_sort_program(program)
+    models = [list(save_model(m)) for m in get_clingo_stable_models(program)]
+    reified = reify_list(sorted_program)
+    recursion = analyzer.check_positive_recursion()
+
+    per_model = build_graph(models, reified, sorted_program, analyzer, recursion, workers=1, batched=False)
+    derivation_cache.clear()
+    batched = build_graph(models, reified, sorted_program, analyzer, recursion, workers=1, batched=True)
+    assert describe_graph(batched) == describe_graph(per_model)
+    derivation_cache.clear()
+    parallel = build_graph(models, reified, sorted_program, analyzer, recursion, workers=2, batched=True)
+    assert describe_graph(parallel) == describe_graph(per_model)
+
+
+def test_batches_of_models_are_limited_in_size(get_sort_program, monkeypatch):
+    program = "a. {b; c; d}. e(X) :- X = 1..3, b. f :- c, e(2), not d. g :- #count{X: e(X)} > 1, f."
+    sorted_program, analyzer = get_sort_program(program)
+    models = [list(save_model(m)) for m in get_clingo_stable_models(program)]
+    assert len(models) > 4
+    justification_program = make_justification_program(
+        reify_list(sorted_program), analyzer.get_facts(), analyzer.get_constants(),
+        analyzer.get_conflict_free_h())
+    names = dict(model=analyzer.get_conflict_free_model(), h=analyzer.get_conflict_free_h(),
+                 h_showTerm=analyzer.get_conflict_free_h_showTerm())
+    batch_sizes = []
+    ground_batch = justify.get_derivations_of_models_batched
+
+    def recording(program, models, **kwargs):
+        batch_sizes.append(len(models))
+        return ground_batch(program, models, **kwargs)
+
+    monkeypatch.setattr(justify, "get_derivations_of_models_batched", recording)
+    per_model = get_derivations_of_models(justification_program, models, workers=1, batched=False, **names)
+    batched = get_derivations_of_models(justification_program, models, workers=1, batched=True,
+                                        batch_size=2, **names)
+    assert max(batch_sizes) == 2
+    assert sum(batch_sizes) == len(models)
+    assert [sorted(map(str, d)) for d in batched] == [sorted(map(str, d)) for d in per_model]
+
+
+def test_reordered_sort_reuses_derivations(get_sort_program):
+    program = "a. {b}. c :- a. d :- b. e :- c, d."
+    sorted_program, analyzer = get_sort_program(program)
+    models = [list(save_model(m)) for m in get_clingo_stable_models(program)]
+    recursion = analyzer.check_positive_recursion()
+    first, second, *rest = sorted_program
+    reordered = [Transformation(i, t.rules, hash=t.hash)
+                 for i, t in enumerate([second, first, *rest], start=first.id)]
+
+    derivation_cache.clear()
+    build_graph(models, reify_list(sorted_program), sorted_program, analyzer, recursion, workers=1)
+    misses = derivation_cache.misses
+    from_cache = build_graph(models, reify_list(reordered), reordered, analyzer, recursion, workers=1)
+    assert derivation_cache.misses == misses
+    derivation_cache.clear()
+    grounded = build_graph(models, reify_list(reordered), reordered, analyzer, recursion, workers=1)
+    assert describe_graph(from_cache) == describe_graph(grounded)
+
+
+def test_recursion_subgraphs_are_computed_once(get_sort_program):
+    program = "{a; b}. j(X, X+1) :- X = 1..3. j(X, Y) :- j(X, Z), j(Z, Y)."
+    sorted_program, analyzer = get_sort_program(program)
+    models = [list(save_model(m)) for m in get_clingo_stable_models(program)]
+    reified = reify_list(sorted_program)
+    recursion = analyzer.check_positive_recursion()
+    assert len(recursion) > 0
+
+    recursion_cache.clear()
+    first = build_graph(models, reified, sorted_program, analyzer, recursion, workers=1)
+    assert recursion_cache.hits == len(models)
+    assert recursion_cache.misses == 0
+    second = build_graph(models, reified, sorted_program, analyzer, recursion, workers=1)
+    assert recursion_cache.hits == 2 * len(models)
+    assert recursion_cache.misses == 0
+    assert describe_graph(first) == describe_graph(second)
+    assert any(len(node.recursive) > 0 for node in second.nodes)
+
+
+def test_recursion_reasoner_respects_step_budget():
+    program = "h(n,p(Y),(p(X),)) :- model(p(X)); e(X,Y); not model(p(Y)). e(X,X+1) :- X = 1..20. model(@new())."
+    found = set()
+    RecursionReasoner(init=[parse_term("p(1)")], program=program, callback=found.add).main()
+    assert max(sym.arguments[0].number for sym in found) == 20
+    assert len(found) == 20
+    with pytest.raises(RuntimeError):
+        RecursionReasoner(init=[parse_term("p(1)")], program=program, callback=found.add, max_steps=5).main()
+
+
+def test_reasons_are_identified_along_the_path(get_sort_program_and_get_graph):
+    program = "j(X, X+1) :- X = 1..3. j(X, Y) :- j(X, Z), j(Z, Y). k(X) :- j(1, X)."
+    graph_info, _ = get_sort_program_and_get_graph(program)
+    g = graph_info[0]
+    path = nx.shortest_path(g, get_start_node_from_graph(g), get_end_node_from_path(g))
+    for i, node in enumerate(path):
+        above = {s.symbol: s for u in path[:i + 1] for s in u.diff}
+        for reasons in node.reason.values():
+            for r in reasons:
+                assert r is above[r.symbol]
+        for subnode in node.recursive:
+            for reasons in subnode.reason.values():
+                assert all(r is not None and r is above[r.symbol] for r in reasons)
+    assert any(len(node.recursive) > 0 for node in path)
+    assert any(len(node.reason) > 0 for node in path)
+
+
+def test_equal_nodes_are_shared_between_paths(get_sort_program):
+    program = "a. d :- a. f :- d. {b; c} :- f. e :- b."
+    sorted_program, analyzer = get_sort_program(program)
+    models = [list(save_model(m)) for m in get_clingo_stable_models(program)]
+    graph = build_graph(models, reify_list(sorted_program), sorted_program, analyzer,
+                        analyzer.check_positive_recursion(), workers=1)
+    for u, v in graph.edges:
+        assert v.parent in graph and any(v.parent is p for p in graph.predecessors(v))
+        assert all(any(a is b for b in v.atoms) for a in u.atoms)
+    uuids = [s.uuid for node in graph.nodes for s in node.diff]
+    assert len(uuids) == len(set(uuids))
+    assert len({node.uuid for node in graph.nodes}) == len(graph.nodes)
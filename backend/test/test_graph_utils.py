@@ -1,4 +1,11 @@
+import heapq
+
+import networkx as nx
+from clingo.ast import parse_string
+
 from viasp.asp.reify import ProgramAnalyzer
+from viasp.asp import utils
+from viasp.asp.utils import topological_sort
 from viasp.shared.model import RuleContainer
 
 def test_topological_sort(app_context):
@@ -12,6 +19,33 @@ def test_topological_sort(app_context):
         assert sorted[i].rules == rules_container[i]
 
 
+def test_topological_sort_of_large_encoding_handles_each_rule_once(monkeypatch):
+    rules = []
+    parse_string("\n".join(f"p{i}(X) :- p{i // 2}(X), q(X)." for i in range(1, 2001)),
+                 lambda rule: rules.append(rule) if hasattr(rule, "head") else None)
+    assert len(rules) == 2000
+    g = nx.DiGraph()
+    containers = [RuleContainer(ast=(rule,), str_=(str(rule),)) for rule in rules]
+    g.add_nodes_from(reversed(containers))
+    for i, container in enumerate(containers, start=1):
+        if i // 2 >= 1:
+            g.add_edge(containers[i // 2 - 1], container)
+
+    heap_operations = {"push": 0, "pop": 0}
+
+    def counting(name, operation):
+        def count(*args):
+            heap_operations[name] += 1
+            return operation(*args)
+        return count
+
+    monkeypatch.setattr(utils, "heappush", counting("push", heapq.heappush))
+    monkeypatch.setattr(utils, "heappop", counting("pop", heapq.heappop))
+    sorted = topological_sort(g, rules)
+    assert sorted == containers
+    assert heap_operations == {"push": len(rules), "pop": len(rules)}
+
+
 def test_topological_sort_2(app_context):
     rules = ["x:-y.",
              "e:-x.",
@@ -60,3 +94,24 @@ def test_adjacent_sorts_2(app_context):
     assert list(adjacent_sorts[4].values()) == [3,5]
     assert list(adjacent_sorts[5].values()) == [3,5]
     assert list(adjacent_sorts[6].values()) == [6,6]
+
+
+def test_moving_a_transformation_updates_adjacent_sorts(app_context):
+    rules = ["x:-y.",
+             "e:-x.",
+             "z:-x.",
+             "d:-z.",
+             "a:-x,z.",
+             "b:-z.",
+             "c:-b,a."]
+    analyzer = ProgramAnalyzer()
+    sorted = analyzer.make_transformations_from_sorted_program(
+        [t.rules for t in analyzer.sort_program('\n'.join(rules))])
+
+    for t in sorted:
+        bounds = t.adjacent_sort_indices
+        for new_index in range(bounds["lower_bound"], bounds["upper_bound"]+1):
+            moved = analyzer.move_transformation(sorted, t.id, new_index)
+            expected = analyzer.make_transformations_from_sorted_program([m.rules for m in moved])
+            assert moved[new_index].rules == t.rules
+            assert [m.adjacent_sort_indices for m in moved] == [e.adjacent_sort_indices for e in expected]
@@ -2,10 +2,11 @@ import networkx as nx
 from networkx import node_link_data, node_link_graph
 from flask import current_app
 
+import clingo
 import clingo.ast
 from clingo import Control, ModelType
 
-from viasp.shared.io import clingo_model_to_stable_model
+from viasp.shared.io import clingo_model_to_stable_model, SymbolTable, graph_from_node_link_data
 from viasp.shared.model import RuleContainer, StableModel, ClingoMethodCall, Signature, Transformation, TransformationError, \
     FailedReason
 from viasp.server.database import get_database
@@ -28,6 +29,35 @@ def test_networkx_graph_with_dataclasses_is_isomorphic_after_dumping_and_loading
                             graph), "Serializing and unserializing a networkx graph should not change it"
 
 
+def test_graph_with_interned_symbols_is_equal_after_dumping_and_loading_again(get_sort_program_and_get_graph):
+    program = "c(1). c(\"x\"). b(X) :- c(X). a(X) :- b(X)."
+    graph_info, _ = get_sort_program_and_get_graph(program)
+    graph = graph_info[0]
+
+    table = SymbolTable()
+    serialized_graph = current_app.json.dumps(node_link_data(graph), symbol_table=table)
+    assert len(serialized_graph) < len(current_app.json.dumps(node_link_data(graph)))
+
+    reloaded_table = SymbolTable(table.take_pending())
+    loaded_graph = graph_from_node_link_data(current_app.json.loads(serialized_graph, symbol_table=reloaded_table))
+    assert nx.is_isomorphic(loaded_graph, graph)
+    originals = {node.uuid.hex: node for node in graph.nodes}
+    for loaded in loaded_graph.nodes:
+        original = originals[loaded.uuid]
+        assert loaded.atoms == original.atoms
+        assert loaded.diff == original.diff
+        assert loaded.reason == original.reason
+
+
+def test_symbol_table_does_not_reuse_ids_of_loaded_symbols():
+    table = SymbolTable([(0, "a"), (2, "b")])
+    id = table.intern(clingo.parse_term("c"))
+    assert id == 3
+    assert table.lookup(0) == clingo.parse_term("a")
+    assert table.lookup(2) == clingo.parse_term("b")
+    assert table.take_pending() == [(3, "c")]
+
+
 def test_serialization_model(app_context):
     ctl = Control(["0"])
     ctl.add("base", [], "{a(1..2)}. b(X) :- a(X).")
@@ -1,8 +1,12 @@
 from typing import List
 
-from clingo.ast import AST, ASTType, parse_string
+import pytest
 
-from viasp.asp.reify import ProgramAnalyzer, transform
+from clingo.ast import AST, ASTType, Transformer, parse_string
+
+from viasp.asp.reify import ProgramAnalyzer, transform, reify_list, reification_cache, fact_base_cache, ReificationCache, \
+    extract_symbols, ModelIndexWrapper
+from viasp.shared.event import Event, publish
 
 
 def assertProgramEqual(actual, expected, message=None):
@@ -56,6 +60,92 @@ def test_conflict_variables_are_resolved():
         parse_program_to_ast(expected))
 
 
+def test_reified_transformations_are_cached_until_the_program_changes(app_context):
+    analyzer = ProgramAnalyzer()
+    analyzer.add_program("a. b :- a. c(X) :- b, X = 1..2.")
+    sorted_program = analyzer.get_sorted_program()
+    reification_cache.clear()
+    first = reify_list(sorted_program, "reified", h=analyzer.get_conflict_free_h())
+    second = reify_list(sorted_program, "reified", h=analyzer.get_conflict_free_h())
+    assert all(a is b for a, b in zip(first, second))
+    other = reify_list(sorted_program, "other", h=analyzer.get_conflict_free_h())
+    publish(Event.PROGRAM_CHANGED, encoding_id="reified")
+    third = reify_list(sorted_program, "reified", h=analyzer.get_conflict_free_h())
+    assertProgramEqual(third, first)
+    assert not any(a is b for a, b in zip(first, third))
+    assert all(a is b for a, b in zip(other, reify_list(sorted_program, "other", h=analyzer.get_conflict_free_h())))
+
+
+def test_reification_cache_is_bounded(app_context):
+    analyzer = ProgramAnalyzer()
+    analyzer.add_program("a. b :- a. c :- b.")
+    sorted_program = analyzer.get_sorted_program()
+    cache = ReificationCache(max_entries=1)
+    for transformation in sorted_program:
+        cache.put(ReificationCache.key("bounded", transformation, transformation.id, {}), [])
+    assert len(sorted_program) > 1
+    assert cache.get(ReificationCache.key("bounded", sorted_program[0], sorted_program[0].id, {})) is None
+    assert cache.get(ReificationCache.key("bounded", sorted_program[-1], sorted_program[-1].id, {})) == []
+
+
+def test_fact_base_is_grounded_once():
+    analyzer = ProgramAnalyzer()
+    analyzer.add_program("#const n = 2. a(1..n). b(x). c(X) :- a(X).")
+    fact_base_cache.clear()
+    facts = analyzer.get_facts()
+    assert sorted(map(str, facts)) == ["a(1)", "a(2)", "b(x)"]
+    assert (fact_base_cache.hits, fact_base_cache.misses) == (0, 1)
+    assert analyzer.get_facts() == facts
+    assert (fact_base_cache.hits, fact_base_cache.misses) == (1, 1)
+    same_program = ProgramAnalyzer()
+    same_program.add_program("#const n = 2. a(1..n). b(x). c(X) :- a(X).")
+    assert same_program.get_facts() == facts
+    assert (fact_base_cache.hits, fact_base_cache.misses) == (2, 1)
+    assert facts == extract_symbols(analyzer.facts, analyzer.constants)
+    other_program = ProgramAnalyzer()
+    other_program.add_program("#const n = 3. a(1..n). b(x). c(X) :- a(X).")
+    assert len(other_program.get_facts()) == 4
+    assert (fact_base_cache.hits, fact_base_cache.misses) == (2, 2)
+
+
+def make_x_renamer():
+    class Renamer(Transformer):
+        def visit_Function(self, function):
+            return function.update(name="x") if function.name == "a" else function
+    return Renamer
+
+
+def make_y_renamer():
+    class Renamer(Transformer):
+        def visit_Function(self, function):
+            return function.update(name="y") if function.name == "a" else function
+    return Renamer
+
+
+def test_fact_bases_of_transformers_with_the_same_name_are_kept_apart():
+    analyzers = []
+    for make_renamer in (make_x_renamer, make_y_renamer):
+        analyzer = ProgramAnalyzer()
+        analyzer.add_program("a(1). b(2).", make_renamer())
+        analyzers.append(analyzer)
+    assert analyzers[0].program_hash != analyzers[1].program_hash
+    assert sorted(map(str, analyzers[0].get_facts())) == ["b(2)", "x(1)"]
+    assert sorted(map(str, analyzers[1].get_facts())) == ["b(2)", "y(1)"]
+
+
+def test_only_rules_are_indexed_by_model():
+    program, external, show, rule = parse_program_to_ast(
+        "#external a. #show b/0. b :- a, #count{X: c(X)} > 0.")
+    wrapper = ModelIndexWrapper()
+    assert wrapper.wrap(program) is program
+    for statement in (external, show):
+        with pytest.raises(ValueError):
+            wrapper.wrap(statement)
+    assertProgramEqual([wrapper.wrap(rule)], parse_program_to_ast(
+        "model(M,b) :- model(M); model(M,a); 0 < #count { X: model(M,c(X)) }.")[1:])
+    assert str(wrapper.visit(external)) == str(external)
+
+
 def test_normal_rule_with_negation_is_transformed_correctly():
     rule = "b(X) :- c(X), not a(X)."
     expected = "h(1, b(X), (c(X),)) :- b(X), c(X); not a(X)."
@@ -1,4 +1,8 @@
+from dataclasses import replace
+from uuid import uuid4
+
 from viasp.asp.replayer import apply_multiple
+from viasp.server.database import GraphAccessor, get_database
 
 
 def test_run(clingo_call_run_sample, app_context):
@@ -9,3 +13,18 @@ def test_run(clingo_call_run_sample, app_context):
             _ = m.symbols(atoms=True)
             num_models += 1
     assert num_models == 2
+
+
+def test_replayed_programs_are_written_in_one_transaction(clingo_call_run_sample, app_context, monkeypatch):
+    depths = []
+    add_to_program = GraphAccessor.add_to_program
+
+    def recording(self, program, encoding_id):
+        depths.append(self._transaction_depth)
+        add_to_program(self, program, encoding_id)
+
+    monkeypatch.setattr(GraphAccessor, "add_to_program", recording)
+    calls = clingo_call_run_sample[:2] + [replace(clingo_call_run_sample[1], uuid=uuid4())]
+    apply_multiple(calls)
+    assert depths == [1, 1]
+    assert not get_database().conn.in_transaction